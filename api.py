@@ -1,10 +1,25 @@
-from flask import Flask, request, jsonify
-from bq_client import BigQueryClient
+from flask import Flask, Response, g, request, jsonify
+from bq_client import BigQueryClient, LazyBigQueryClient, PRIMARY_KEYS, SUMMARY_TABLE
+from backups import (
+    DATASET_TABLES, backup_dataset, backup_incremental, restore_dataset, restore_from_manifest
+)
+from cache import ResultCache
+from dimensions import DIMENSION_TABLES, DimensionCache, DimensionUnavailable
+from ingest_queue import IngestGate, IngestPaused, IngestQueue, IngestQueueClosed
+from metrics import REQUEST_LATENCY, REQUESTS
+from pk_index import PrimaryKeyIndexes
 from validation import validate_departments, validate_jobs, validate_hired_employees
 import os
+import atexit
+import json
+import time
 from functools import wraps
 from google.cloud import bigquery
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
 import logging
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from datetime import datetime, timezone
 
 # Configuración de logging
@@ -12,16 +27,58 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 
 app = Flask(__name__)
 
+
+# Latencia y código de estado de todos los requests
+@app.before_request
+def start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        endpoint = request.endpoint or "not_found"
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - start)
+        REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    return response
+
 PROJECT_ID = "migracionpoc"
 DATASET = "migration_poc"
 CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
-# Cliente de BigQuery
-bq = BigQueryClient(PROJECT_ID, DATASET, credentials_path=CREDENTIALS_PATH)
+# Cliente de BigQuery (se crea en el primer uso de cada worker)
+bq = LazyBigQueryClient(lambda: BigQueryClient(PROJECT_ID, DATASET, credentials_path=CREDENTIALS_PATH))
 
 # API Key
 API_KEY = os.getenv("API_KEY")
 
+# Índice local de claves primarias para rechazar duplicados antes de insertar
+# (se calienta desde BigQuery al arrancar cada worker; si falla, en el primer uso de cada tabla)
+pk_indexes = PrimaryKeyIndexes(
+    lambda table: bq.primary_keys(table),
+    bloom=os.getenv("PK_INDEX_BLOOM", "true").lower() == "true",
+)
+
+# Caché de departments y jobs para validar las claves foráneas de hired_employees
+dimensions = DimensionCache(lambda table: bq.dimension_names(table))
+
+# Caché de resultados de analytics (los años pasados casi no cambian: TTL más largo)
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+ANALYTICS_CACHE_TTL_PAST = int(os.getenv("ANALYTICS_CACHE_TTL_PAST", "86400"))
+analytics_cache = ResultCache(
+    ttl_seconds=ANALYTICS_CACHE_TTL,
+    max_entries=int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("ANALYTICS_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+)
+
+# Tablas de las que depende cada endpoint de analytics (el resumen se actualiza
+# junto con hired_employees, así que se invalida por esa tabla)
+ANALYTICS_DEPENDENCIES = {
+    "hired_by_quarter": ("hired_employees", "departments", "jobs"),
+    "departments_above_average": ("hired_employees", "departments"),
+}
+
 def require_api_key(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -32,6 +89,19 @@ def require_api_key(f):
         return f(*args, **kwargs)
     return decorated
 
+# Ingestas en curso: la migración de esquema las pausa (503) mientras reescribe las tablas
+ingest_gate = IngestGate()
+
+def pausable(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        try:
+            with ingest_gate.enter():
+                return f(*args, **kwargs)
+        except IngestPaused as e:
+            return jsonify({"error": str(e)}), 503
+    return decorated
+
 # Diccionario de validadores por tabla
 VALIDATORS = {
     "departments": validate_departments,
@@ -45,48 +115,250 @@ def home():
     """Ruta de prueba para verificar que la API funciona"""
     return jsonify({"message": "API de Migración funcionando"}), 200
 
+def validate_records(table, records):
+    """Valida los registros; los inválidos van a la DLQ. Devuelve (válidos, errores)"""
+    validator = VALIDATORS[table]
+    valid_data, valid_index, errors = [], [], []
+
+    for i, record in enumerate(records, start=1):
+        try:
+            validated, error = validator(record)
+            if not error:
+                error = dimensions.reference_error(table, validated)
+            if error:
+                errors.append({"index": i, "record": record, "error": error})
+                bq.insert_dlq(table, record, error)
+            else:
+                valid_data.append(validated)
+                valid_index.append(i)
+        except DimensionUnavailable:
+            # Fallo de BigQuery, no del registro: no se manda a la DLQ (el request responde 503)
+            raise
+        except Exception as e:
+            errors.append({"index": i, "record": record, "error": str(e)})
+            bq.insert_dlq(table, record, str(e))
+
+    if valid_data and table in PRIMARY_KEYS:
+        # Comprobación en bloque contra el índice de claves: los duplicados van a la DLQ
+        key = PRIMARY_KEYS[table]
+        duplicated = pk_indexes.claim(table, [row[key] for row in valid_data])
+        kept = []
+        for i, row, is_duplicate in zip(valid_index, valid_data, duplicated):
+            if is_duplicate:
+                error = f"{key} duplicado: {row[key]} ya existe en {table}"
+                errors.append({"index": i, "record": row, "error": error})
+                bq.insert_dlq(table, row, error)
+            else:
+                kept.append(row)
+        valid_data = kept
+        errors.sort(key=lambda error: error["index"])
+
+    # Enviar en bloque los rechazos del request
+    bq.flush_dlq()
+    return valid_data, errors
+
+def insert_validated(table, rows):
+    """Inserta filas validadas y mantiene el resumen y la caché de analytics.
+    Devuelve (insertadas, índices de las filas que fallaron y se enviaron a la DLQ)"""
+    inserted, failed = bq.insert_rows_with_failures(table, rows)
+    if failed:
+        # Las filas que fallaron ya están en la DLQ: se liberan sus claves para poder reintentar
+        if table in PRIMARY_KEYS:
+            pk_indexes.release(table, [rows[i][PRIMARY_KEYS[table]] for i in failed])
+        failed_set = set(failed)
+        rows = [row for i, row in enumerate(rows) if i not in failed_set]
+    if inserted:
+        if table == "hired_employees":
+            bq.update_hiring_summary(rows)
+        if table in DIMENSION_TABLES:
+            dimensions.add(table, rows)
+        analytics_cache.invalidate_table(table)
+    return inserted, failed
+
+# Escritor en segundo plano para /ingest/async
+ingest_queue = IngestQueue(
+    insert_validated,
+    max_batch_rows=int(os.getenv("ASYNC_INGEST_BATCH_ROWS", "5000")),
+    max_wait_seconds=float(os.getenv("ASYNC_INGEST_MAX_WAIT", "1")),
+)
+
+def drain_ingest_queue():
+    """Al parar el proceso: inserta lo que quede en la cola de /ingest/async (gunicorn lo llama en worker_exit)"""
+    ingest_queue.drain(timeout=float(os.getenv("ASYNC_INGEST_DRAIN_SECONDS", "25")))
+
+atexit.register(drain_ingest_queue)
+
+def parse_ingest_payload():
+    """Devuelve (table, records, None) o (None, None, respuesta de error)"""
+    payload = request.get_json(force=True)
+
+    if not payload or "table" not in payload or "records" not in payload:
+        return None, None, (jsonify({"error": "El request debe incluir 'table' y 'records'"}), 400)
+
+    table = payload["table"]
+    records = payload["records"]
+
+    if table not in VALIDATORS:
+        return None, None, (jsonify({"error": f"Tabla '{table}' no soportada"}), 400)
+
+    if not isinstance(records, list) or len(records) == 0 or len(records) > 1000:
+        return None, None, (jsonify({"error": "Debe enviar entre 1 y 1000 registros"}), 400)
+
+    return table, records, None
+
+def metrics_response():
+    # Con PROMETHEUS_MULTIPROC_DIR se suman las métricas de todos los workers de gunicorn;
+    # sin él cada scrape vería solo las del worker que atiende el request
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus (sin API Key: el scraper no la envía)"""
+    return metrics_response()
+
 @app.route("/ingest", methods=["POST"])
 @require_api_key
+@pausable
 def ingest_data():
     """Endpoint para insertar registros en BigQuery con validación"""
     try:
-        payload = request.get_json(force=True)
+        table, records, error_response = parse_ingest_payload()
+        if error_response:
+            return error_response
+
+        valid_data, errors = validate_records(table, records)
+
+        response = {"inserted": 0, "errors": errors}
+        if valid_data:
+            response["inserted"], _ = insert_validated(table, valid_data)
+
+        return jsonify(response), (200 if valid_data else 400)
+    except DimensionUnavailable as e:
+        logging.error(f"Ingest error: {str(e)}")
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logging.error(f"Ingest error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        if not payload or "table" not in payload or "records" not in payload:
-            return jsonify({"error": "El request debe incluir 'table' y 'records'"}), 400
+@app.route("/ingest/async", methods=["POST"])
+@require_api_key
+@pausable
+def ingest_data_async():
+    """Valida y encola los registros; la inserción se hace en segundo plano"""
+    try:
+        table, records, error_response = parse_ingest_payload()
+        if error_response:
+            return error_response
 
-        table = payload["table"]
-        records = payload["records"]
+        valid_data, errors = validate_records(table, records)
+        try:
+            ingest_id = ingest_queue.submit(table, valid_data, errors)
+        except IngestQueueClosed:
+            # Las claves se reservaron al validar pero las filas no se encolan: se liberan para reintentar
+            if table in PRIMARY_KEYS:
+                pk_indexes.release(table, [row[PRIMARY_KEYS[table]] for row in valid_data])
+            raise
+        return jsonify({
+            "id": ingest_id,
+            "accepted": len(valid_data),
+            "errors": errors,
+            "status_url": f"/ingest/status/{ingest_id}",
+            # El estado vive en memoria del worker que aceptó el request
+            "note": "El estado solo está disponible en el worker que aceptó la petición "
+                    f"(pid {os.getpid()}); con API_WORKERS > 1 otro worker responde 404",
+        }), (202 if valid_data else 400)
+    except (IngestQueueClosed, DimensionUnavailable) as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logging.error(f"Async ingest error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        if table not in VALIDATORS:
-            return jsonify({"error": f"Tabla '{table}' no soportada"}), 400
+# Tamaño de lote para /ingest/stream y longitud máxima de cada línea NDJSON
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
 
-        if not isinstance(records, list) or len(records) == 0 or len(records) > 1000:
-            return jsonify({"error": "Debe enviar entre 1 y 1000 registros"}), 400
+def read_lines(stream, max_bytes):
+    """Líneas del body; las de más de max_bytes se descartan sin leerlas enteras en memoria (se devuelve None)"""
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_bytes and not line.endswith(b"\n"):
+            # Se consume el resto de la línea por trozos
+            while True:
+                rest = stream.readline(max_bytes)
+                if not rest or rest.endswith(b"\n"):
+                    break
+            yield None
+            continue
+        yield line
 
-        validator = VALIDATORS[table]
-        valid_data, errors = [], []
+@app.route("/ingest/stream/<table>", methods=["POST"])
+@require_api_key
+@pausable
+def ingest_stream(table):
+    """Ingesta NDJSON en streaming: valida e inserta por lotes, sin límite de registros"""
+    if table not in VALIDATORS:
+        return jsonify({"error": f"Tabla '{table}' no soportada"}), 400
 
-        for i, record in enumerate(records, start=1):
-            try:
-                validated, error = validator(record)
-                if error:
-                    errors.append({"index": i, "record": record, "error": error})
-                    bq.insert_dlq(table, record, error)
-                else:
-                    valid_data.append(validated)
-            except Exception as e:
-                errors.append({"index": i, "record": record, "error": str(e)})
-                bq.insert_dlq(table, record, str(e))
+    summary = {"inserted": 0, "rejected": 0, "failed": 0, "batches": 0}
 
-        response = {"inserted": 0, "errors": errors}
+    def process_batch(batch):
+        valid_data, errors = validate_records(table, batch)
+        summary["rejected"] += len(errors)
+        summary["batches"] += 1
         if valid_data:
-            response["inserted"] = bq.insert_rows(table, valid_data)
+            # Las filas válidas que BigQuery no aceptó (van a la DLQ) cuentan como failed
+            inserted, _ = insert_validated(table, valid_data)
+            summary["inserted"] += inserted
+            summary["failed"] += len(valid_data) - inserted
 
-        return jsonify(response), (200 if valid_data else 400)
+    try:
+        batch = []
+        # Se lee el body línea a línea: la memoria no depende del tamaño del request
+        for line in read_lines(request.stream, STREAM_MAX_LINE_BYTES):
+            if line is None:
+                summary["rejected"] += 1
+                bq.insert_dlq(table, None, f"Línea de más de {STREAM_MAX_LINE_BYTES} bytes")
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(json.loads(line))
+            except ValueError:
+                summary["rejected"] += 1
+                bq.insert_dlq(table, line.decode("utf-8", errors="replace"), "JSON inválido")
+                continue
+            if len(batch) >= STREAM_BATCH_SIZE:
+                process_batch(batch)
+                batch = []
+        if batch:
+            process_batch(batch)
+        bq.flush_dlq()
+
+        return jsonify(summary), 200
+    except DimensionUnavailable as e:
+        bq.flush_dlq()
+        logging.error(f"Stream ingest error: {str(e)}")
+        return jsonify({"error": str(e), **summary}), 503
     except Exception as e:
-        logging.error(f"Ingest error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        bq.flush_dlq()
+        logging.error(f"Stream ingest error: {str(e)}")
+        return jsonify({"error": str(e), **summary}), 500
+
+@app.route("/ingest/status/<ingest_id>", methods=["GET"])
+@require_api_key
+def ingest_status(ingest_id):
+    """Estado de una ingesta asíncrona (queued, done o failed)"""
+    status = ingest_queue.status(ingest_id)
+    if status is None:
+        return jsonify({"error": f"Ingesta '{ingest_id}' no encontrada"}), 404
+    return jsonify(status), 200
 
 @app.route("/backup/<table_name>", methods=["POST"])
 @require_api_key
@@ -102,12 +374,44 @@ def backup_table(table_name):
             return jsonify({"status": "ok", "job": str(job.job_id)}), 200
         else:
             local_path = body.get("local_path", f"/tmp/{table_name}_{datetime.now().strftime('%Y%m%d%H%M%S')}.parquet")
-            path = bq.export_table_to_local_parquet(table_name, local_path)
+            parquet_options = {
+                "row_group_size": int(body.get("row_group_size", 100_000)),
+                "compression": body.get("compression", "snappy"),
+            }
+            if body.get("incremental"):
+                # Con "previous_manifest" solo se exportan las filas posteriores a su marca de agua
+                manifest = backup_incremental(
+                    bq, table_name, local_path, body.get("previous_manifest"), **parquet_options
+                )
+                return jsonify({"status": "ok", "path": local_path, "manifest": manifest}), 200
+            path = bq.export_table_to_local_parquet(table_name, local_path, **parquet_options)
             return jsonify({"status": "ok", "path": path}), 200
     except Exception as e:
         logging.error(f"Backup error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def invalidate_restored(tables):
+    """Descarta caché de analytics, índice de claves y dimensiones de las tablas restauradas"""
+    for table_name in tables:
+        analytics_cache.invalidate_table(table_name)
+        pk_indexes.invalidate(table_name)
+        dimensions.invalidate(table_name)
+
+def rebuild_summary_after_restore(tables):
+    """Reconstruye el resumen si se restauró hired_employees; devuelve su estado para la respuesta
+    (un fallo aquí no deshace el restore, que ya se completó)"""
+    if "hired_employees" not in tables:
+        return None
+    try:
+        job = bq.rebuild_hiring_summary()
+        return {"status": "ok", "job": str(job.job_id)}
+    except Exception as e:
+        logging.error(f"Summary rebuild after restore error: {str(e)}")
+        return {"status": "failed", "error": str(e)}
+    finally:
+        # Lo cacheado mientras se reconstruía puede venir del resumen anterior
+        analytics_cache.invalidate_table("hired_employees")
+
 @app.route("/restore/<table_name>", methods=["POST"])
 @require_api_key
 def restore_table(table_name):
@@ -120,13 +424,104 @@ def restore_table(table_name):
         if source == "gcs":
             gcs_uri = body["gcs_uri"]
             job = bq.restore_table_from_gcs(table_name, gcs_uri, source_format=fmt, write_disposition=write_disp)
+            jobs = [job]
+        elif "manifest" in body:
+            # Cadena de manifests: backup base + incrementales en orden
+            jobs = restore_from_manifest(bq, table_name, body["manifest"], source_format=fmt)
+            job = jobs[-1]
         else:
             local_path = body["local_path"]
             job = bq.restore_table_from_local_file(table_name, local_path, source_format=fmt, write_disposition=write_disp)
-        return jsonify({"status": "ok", "job": str(job.job_id)}), 200
+            jobs = [job]
     except Exception as e:
+        # Un load job puede haber escrito parte de los datos: se descarta lo cacheado igualmente
+        invalidate_restored([table_name])
         logging.error(f"Restore error: {str(e)}")
         return jsonify({"error": str(e)}), 500
+    invalidate_restored([table_name])
+    response = {"status": "ok", "job": str(job.job_id), "jobs": [str(j.job_id) for j in jobs]}
+    summary = rebuild_summary_after_restore([table_name])
+    if summary is not None:
+        response["summary"] = summary
+    return jsonify(response), 200
+
+@app.route("/backup", methods=["POST"])
+@require_api_key
+def backup_dataset_endpoint():
+    """Backup de todo el dataset en shards Parquet locales, en paralelo, con manifest"""
+    body = request.get_json(silent=True) or {}
+    out_dir = body.get("local_dir", f"/tmp/backup_{datetime.now().strftime('%Y%m%d%H%M%S')}")
+    try:
+        manifest = backup_dataset(
+            bq, out_dir,
+            tables=body.get("tables", DATASET_TABLES),
+            rows_per_shard=int(body.get("rows_per_shard", 1_000_000)),
+            max_workers=int(body.get("max_workers", 8)),
+            row_group_size=int(body.get("row_group_size", 100_000)),
+            compression=body.get("compression", "snappy"),
+        )
+        return jsonify({"status": "ok", "manifest": manifest}), 200
+    except Exception as e:
+        logging.error(f"Dataset backup error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/restore", methods=["POST"])
+@require_api_key
+def restore_dataset_endpoint():
+    """Restaura el dataset desde el manifest de un backup por shards"""
+    body = request.get_json(force=True)
+    try:
+        results = restore_dataset(
+            bq, body["manifest"],
+            tables=body.get("tables"),
+            max_workers=int(body.get("max_workers", 8)),
+        )
+    except Exception as e:
+        # Las tablas que terminaron antes del fallo ya se sustituyeron
+        invalidate_restored(body.get("tables") or DATASET_TABLES)
+        logging.error(f"Dataset restore error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    invalidate_restored(results)
+    response = {
+        "status": "ok",
+        "jobs": {name: [str(job.job_id) for job in jobs] for name, jobs in results.items()},
+    }
+    summary = rebuild_summary_after_restore(results)
+    if summary is not None:
+        response["summary"] = summary
+    return jsonify(response), 200
+
+@app.route("/summary/rebuild", methods=["POST"])
+@require_api_key
+def rebuild_summary():
+    """Reconstruye desde cero la tabla resumen de contrataciones"""
+    try:
+        job = bq.rebuild_hiring_summary()
+        analytics_cache.invalidate_table("hired_employees")
+        return jsonify({"status": "ok", "job": str(job.job_id)}), 200
+    except Exception as e:
+        logging.error(f"Summary rebuild error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/schema/migrate", methods=["POST"])
+@require_api_key
+def migrate_schema():
+    """Crea o migra hired_employees y el resumen a tablas particionadas y agrupadas"""
+    # Las filas que llegaran mientras se copia la tabla se perderían: se pausan las ingestas
+    # de este worker (los demás workers y el ETL deben estar parados)
+    timeout = float(os.getenv("SCHEMA_MIGRATE_WAIT_SECONDS", "30"))
+    try:
+        with ingest_gate.paused("migración de esquema en curso", timeout=timeout):
+            if not ingest_queue.wait_idle(timeout=timeout):
+                raise TimeoutError("La cola de /ingest/async no se vació a tiempo")
+            result = bq.ensure_schema(migrate=True)
+        analytics_cache.invalidate_table("hired_employees")
+        return jsonify({"status": "ok", "tables": result}), 200
+    except (IngestPaused, TimeoutError) as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        logging.error(f"Schema migrate error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
 def validate_year(year: int):
     """Valida que el año sea razonable"""
@@ -134,6 +529,104 @@ def validate_year(year: int):
     if year < 1900 or year > current_year:
         raise ValueError(f"El año debe estar entre 2000 y {current_year}")
 
+# Formatos de respuesta de analytics (negociados con el header Accept; JSON por defecto)
+ANALYTICS_FORMATS = {
+    "application/json": "json",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.parquet": "parquet",
+}
+FORMAT_MIMETYPES = {fmt: mimetype for mimetype, fmt in ANALYTICS_FORMATS.items()}
+
+def negotiate_format():
+    mimetype = request.accept_mimetypes.best_match(list(ANALYTICS_FORMATS), default="application/json")
+    return ANALYTICS_FORMATS[mimetype]
+
+def serialize_table(table, fmt):
+    """Serializa una tabla de Arrow en el formato pedido"""
+    if fmt == "json":
+        return table.to_pandas().to_json(orient="records")
+    sink = pa.BufferOutputStream()
+    if fmt == "arrow":
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+def cache_options(endpoint, year, generation):
+    # generation: la de las tablas antes de consultar, para no guardar un resultado invalidado mientras corría
+    past_year = year < datetime.now(timezone.utc).year
+    return {
+        "tables": ANALYTICS_DEPENDENCIES[endpoint],
+        "ttl": ANALYTICS_CACHE_TTL_PAST if past_year else ANALYTICS_CACHE_TTL,
+        "generation": generation,
+    }
+
+def cached_analytics(endpoint, year, run_query, fmt="json"):
+    """Devuelve el resultado del endpoint para el año en `fmt`, desde caché o ejecutando la consulta"""
+    key = (endpoint, year, fmt)
+    body = analytics_cache.get(key)
+    if body is None:
+        bq.ensure_hiring_summary()
+        options = cache_options(endpoint, year, analytics_cache.generation(ANALYTICS_DEPENDENCIES[endpoint]))
+        # El resultado se guarda también en Arrow IPC para servir otros formatos sin consultar
+        arrow_key = (endpoint, year, "arrow")
+        arrow_body = analytics_cache.get(arrow_key)
+        if arrow_body is None:
+            table = run_query()
+            analytics_cache.set(arrow_key, serialize_table(table, "arrow"), **options)
+        else:
+            table = pa.ipc.open_stream(arrow_body).read_all()
+        body = serialize_table(table, fmt)
+        if fmt != "arrow":
+            analytics_cache.set(key, body, **options)
+    return body
+
+def cached_analytics_range(endpoint, from_year, to_year, run_query, fmt="json"):
+    """Resultado de varios años (con columna `year`) en una sola consulta; se guarda por año"""
+    years = range(from_year, to_year + 1)
+    cached = [analytics_cache.get((endpoint, year, "arrow")) for year in years]
+    if all(body is not None for body in cached):
+        parts = []
+        for year, body in zip(years, cached):
+            part = pa.ipc.open_stream(body).read_all()
+            parts.append(part.add_column(0, "year", pa.array([year] * part.num_rows, pa.int64())))
+        table = pa.concat_tables([part.cast(parts[0].schema) for part in parts])
+    else:
+        bq.ensure_hiring_summary()
+        generation = analytics_cache.generation(ANALYTICS_DEPENDENCIES[endpoint])
+        table = run_query()
+        columns = [name for name in table.column_names if name != "year"]
+        for year in years:
+            part = table.filter(pc.equal(table["year"], year)).select(columns)
+            analytics_cache.set(
+                (endpoint, year, "arrow"), serialize_table(part, "arrow"), **cache_options(endpoint, year, generation)
+            )
+    return serialize_table(table, fmt)
+
+def validate_year_range(from_year: int, to_year: int):
+    validate_year(from_year)
+    validate_year(to_year)
+    if from_year > to_year:
+        raise ValueError("El año inicial no puede ser mayor que el final")
+
+def year_range_config(from_year, to_year):
+    return bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("from_year", "INT64", from_year),
+            bigquery.ScalarQueryParameter("to_year", "INT64", to_year),
+        ]
+    )
+
+def explain_requested():
+    """?explain=1: devolver la estimación de coste (dry run) en lugar de ejecutar la consulta"""
+    return request.args.get("explain", "").lower() in ("1", "true", "yes")
+
+def analytics_response(body, fmt):
+    if fmt == "json":
+        return body, 200
+    return Response(body, status=200, mimetype=FORMAT_MIMETYPES[fmt])
+
 @app.route("/analytics/hired_by_quarter/<int:year>", methods=["GET"])
 @require_api_key
 def hired_by_quarter(year):
@@ -144,22 +637,29 @@ def hired_by_quarter(year):
         SELECT
             d.name AS department,
             j.name AS job,
-            SUM(CASE WHEN EXTRACT(QUARTER FROM DATE(h.hired_timestamp)) = 1 THEN 1 ELSE 0 END) AS Q1,
-            SUM(CASE WHEN EXTRACT(QUARTER FROM DATE(h.hired_timestamp)) = 2 THEN 1 ELSE 0 END) AS Q2,
-            SUM(CASE WHEN EXTRACT(QUARTER FROM DATE(h.hired_timestamp)) = 3 THEN 1 ELSE 0 END) AS Q3,
-            SUM(CASE WHEN EXTRACT(QUARTER FROM DATE(h.hired_timestamp)) = 4 THEN 1 ELSE 0 END) AS Q4
-        FROM `{PROJECT_ID}.{DATASET}.hired_employees` h
-        JOIN `{PROJECT_ID}.{DATASET}.departments` d ON h.department_id = d.id
-        JOIN `{PROJECT_ID}.{DATASET}.jobs` j ON h.job_id = j.id
-        WHERE EXTRACT(YEAR FROM DATE(h.hired_timestamp)) = @year
+            SUM(IF(s.quarter = 1, s.hired, 0)) AS Q1,
+            SUM(IF(s.quarter = 2, s.hired, 0)) AS Q2,
+            SUM(IF(s.quarter = 3, s.hired, 0)) AS Q3,
+            SUM(IF(s.quarter = 4, s.hired, 0)) AS Q4
+        FROM `{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}` s
+        JOIN `{PROJECT_ID}.{DATASET}.departments` d ON s.department_id = d.id
+        JOIN `{PROJECT_ID}.{DATASET}.jobs` j ON s.job_id = j.id
+        WHERE s.year = @year
         GROUP BY department, job
         ORDER BY department ASC, job ASC
         """
         job_config = bigquery.QueryJobConfig(
             query_parameters=[bigquery.ScalarQueryParameter("year", "INT64", year)]
         )
-        df = bq.client.query(query, job_config=job_config).result().to_dataframe()
-        return df.to_json(orient="records"), 200
+        if explain_requested():
+            return jsonify(bq.dry_run_query(query, job_config)), 200
+        fmt = negotiate_format()
+        body = cached_analytics(
+            "hired_by_quarter", year,
+            lambda: bq.query_to_arrow(query, job_config, name="hired_by_quarter"),
+            fmt,
+        )
+        return analytics_response(body, fmt)
     except Exception as e:
         logging.error(f"Hired_by_quarter error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -175,10 +675,10 @@ def departments_above_average(year):
             SELECT
                 d.id AS department_id,
                 d.name AS department,
-                COUNT(*) AS hired
-            FROM `{PROJECT_ID}.{DATASET}.hired_employees` h
-            JOIN `{PROJECT_ID}.{DATASET}.departments` d ON h.department_id = d.id
-            WHERE EXTRACT(YEAR FROM DATE(h.hired_timestamp)) = @year
+                SUM(s.hired) AS hired
+            FROM `{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}` s
+            JOIN `{PROJECT_ID}.{DATASET}.departments` d ON s.department_id = d.id
+            WHERE s.year = @year
             GROUP BY d.id, d.name
         ),
         avg_hires AS (
@@ -193,12 +693,105 @@ def departments_above_average(year):
         job_config = bigquery.QueryJobConfig(
             query_parameters=[bigquery.ScalarQueryParameter("year", "INT64", year)]
         )
-        df = bq.client.query(query, job_config=job_config).result().to_dataframe()
-        return df.to_json(orient="records"), 200
+        if explain_requested():
+            return jsonify(bq.dry_run_query(query, job_config)), 200
+        fmt = negotiate_format()
+        body = cached_analytics(
+            "departments_above_average", year,
+            lambda: bq.query_to_arrow(query, job_config, name="departments_above_average"),
+            fmt,
+        )
+        return analytics_response(body, fmt)
     except Exception as e:
         logging.error(f"Departments_above_average error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/analytics/hired_by_quarter/<int:from_year>/<int:to_year>", methods=["GET"])
+@require_api_key
+def hired_by_quarter_range(from_year, to_year):
+    """Contrataciones por trimestre, cargo y departamento para un rango de años"""
+    try:
+        validate_year_range(from_year, to_year)
+        query = f"""
+        SELECT
+            s.year AS year,
+            d.name AS department,
+            j.name AS job,
+            SUM(IF(s.quarter = 1, s.hired, 0)) AS Q1,
+            SUM(IF(s.quarter = 2, s.hired, 0)) AS Q2,
+            SUM(IF(s.quarter = 3, s.hired, 0)) AS Q3,
+            SUM(IF(s.quarter = 4, s.hired, 0)) AS Q4
+        FROM `{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}` s
+        JOIN `{PROJECT_ID}.{DATASET}.departments` d ON s.department_id = d.id
+        JOIN `{PROJECT_ID}.{DATASET}.jobs` j ON s.job_id = j.id
+        WHERE s.year BETWEEN @from_year AND @to_year
+        GROUP BY year, department, job
+        ORDER BY year ASC, department ASC, job ASC
+        """
+        job_config = year_range_config(from_year, to_year)
+        if explain_requested():
+            return jsonify(bq.dry_run_query(query, job_config)), 200
+        fmt = negotiate_format()
+        body = cached_analytics_range(
+            "hired_by_quarter", from_year, to_year,
+            lambda: bq.query_to_arrow(query, job_config, name="hired_by_quarter_range"),
+            fmt,
+        )
+        return analytics_response(body, fmt)
+    except Exception as e:
+        logging.error(f"Hired_by_quarter range error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/analytics/departments_above_average/<int:from_year>/<int:to_year>", methods=["GET"])
+@require_api_key
+def departments_above_average_range(from_year, to_year):
+    """Departamentos sobre el promedio de su año, para un rango de años"""
+    try:
+        validate_year_range(from_year, to_year)
+        query = f"""
+        WITH hires_by_dept AS (
+            SELECT
+                s.year AS year,
+                d.id AS department_id,
+                d.name AS department,
+                SUM(s.hired) AS hired
+            FROM `{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}` s
+            JOIN `{PROJECT_ID}.{DATASET}.departments` d ON s.department_id = d.id
+            WHERE s.year BETWEEN @from_year AND @to_year
+            GROUP BY s.year, d.id, d.name
+        ),
+        avg_hires AS (
+            SELECT year, AVG(hired) AS avg_hired FROM hires_by_dept GROUP BY year
+        )
+        SELECT year, department_id AS ID, department AS Department, hired AS Hired
+        FROM hires_by_dept
+        JOIN avg_hires USING (year)
+        WHERE hired > avg_hired
+        ORDER BY year ASC, hired DESC
+        """
+        job_config = year_range_config(from_year, to_year)
+        if explain_requested():
+            return jsonify(bq.dry_run_query(query, job_config)), 200
+        fmt = negotiate_format()
+        body = cached_analytics_range(
+            "departments_above_average", from_year, to_year,
+            lambda: bq.query_to_arrow(query, job_config, name="departments_above_average_range"),
+            fmt,
+        )
+        return analytics_response(body, fmt)
+    except Exception as e:
+        logging.error(f"Departments_above_average range error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def warm_indexes():
+    """Calienta los índices de claves al arrancar; si BigQuery falla se reintenta en el primer uso"""
+    for table in PRIMARY_KEYS:
+        try:
+            pk_indexes.warm([table])
+        except Exception as e:
+            logging.warning(f"No se pudo calentar el índice de claves de {table}: {e}")
+
 if __name__ == "__main__":
+    warm_indexes()
     app.run(host="0.0.0.0", port=5000)
 
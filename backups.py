@@ -0,0 +1,201 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from bq_client import file_sha256
+
+# Tablas incluidas en el backup/restore de todo el dataset
+DATASET_TABLES = ["departments", "jobs", "hired_employees", "dlq"]
+
+# Columna usada como marca de agua en los backups incrementales de cada tabla
+WATERMARK_COLUMNS = {
+    "departments": "id",
+    "jobs": "id",
+    "hired_employees": "id",
+    "dlq": "inserted_at",
+}
+
+# Tipo de la marca de agua (la DLQ guarda inserted_at como texto ISO: se compara como TIMESTAMP)
+WATERMARK_TYPES = {
+    "departments": "INT64",
+    "jobs": "INT64",
+    "hired_employees": "INT64",
+    "dlq": "TIMESTAMP",
+}
+
+
+def serialize_watermark(value, watermark_type):
+    """Marca de agua tal como se guarda en el manifest: entero o texto ISO 8601 en UTC"""
+    if value is None:
+        return None
+    if watermark_type == "INT64":
+        return int(value)
+    return parse_watermark(value, watermark_type).isoformat()
+
+
+def parse_watermark(value, watermark_type):
+    """Marca de agua del manifest al tipo del parámetro de la consulta (int o datetime en UTC)"""
+    if value is None:
+        return None
+    if watermark_type == "INT64":
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def manifest_path_for(data_path):
+    return os.path.splitext(data_path)[0] + ".manifest.json"
+
+
+def read_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(path, manifest):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def manifest_chain(path):
+    """Devuelve la cadena de manifests desde el backup base hasta `path`"""
+    chain = []
+    while path:
+        manifest = read_manifest(path)
+        manifest["manifest_path"] = path
+        chain.append(manifest)
+        path = manifest.get("parent")
+    chain.reverse()
+    if chain[0]["type"] != "full":
+        raise ValueError(f"La cadena de {chain[-1]['manifest_path']} no empieza en un backup completo")
+    return chain
+
+
+def backup_incremental(bq, table_name, local_path, previous_manifest=None, **parquet_options):
+    """Backup local con manifest; si hay manifest previo exporta solo las filas nuevas"""
+    if table_name not in WATERMARK_COLUMNS:
+        raise ValueError(f"Tabla '{table_name}' sin columna de marca de agua para backups incrementales")
+    watermark_column = WATERMARK_COLUMNS[table_name]
+    watermark_type = WATERMARK_TYPES[table_name]
+
+    after = None
+    if previous_manifest:
+        previous = read_manifest(previous_manifest)
+        if previous["table"] != table_name:
+            raise ValueError(f"El manifest {previous_manifest} es de la tabla '{previous['table']}'")
+        after = parse_watermark(previous["watermark"], watermark_type)
+
+    row_count, watermark = bq.export_table_delta_to_local_parquet(
+        table_name, local_path, watermark_column, after=after, watermark_type=watermark_type, **parquet_options
+    )
+    manifest = {
+        "table": table_name,
+        "type": "incremental" if previous_manifest else "full",
+        "file": local_path,
+        "watermark_column": watermark_column,
+        "watermark_type": watermark_type,
+        "watermark_from": serialize_watermark(after, watermark_type),
+        "watermark": serialize_watermark(watermark, watermark_type),
+        "row_count": row_count,
+        "parent": previous_manifest,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    manifest["manifest_path"] = write_manifest(manifest_path_for(local_path), manifest)
+    return manifest
+
+
+def restore_from_manifest(bq, table_name, manifest_path, source_format="PARQUET"):
+    """Restaura el backup base y sus incrementales; la tabla solo se sustituye si todos cargan
+    con el número de filas del manifest"""
+    files = []
+    for manifest in manifest_chain(manifest_path):
+        if manifest["table"] != table_name:
+            raise ValueError(f"El manifest {manifest['manifest_path']} es de la tabla '{manifest['table']}'")
+        files.append({"file": manifest["file"], "rows": manifest["row_count"]})
+    return bq.load_files_atomically(
+        table_name, files, write_disposition="WRITE_TRUNCATE", source_format=source_format
+    )
+
+
+# ------------------
+# Backup y restore de todo el dataset: tablas y shards en paralelo, con un manifest
+# que guarda filas y sha256 de cada shard
+# ------------------
+def plan_shards(num_rows, rows_per_shard):
+    """Rangos (start_index, max_results) de cada shard, todos con un número de filas explícito"""
+    count = max(1, -(-num_rows // rows_per_shard))
+    return [
+        (i * rows_per_shard, min(rows_per_shard, num_rows - i * rows_per_shard))
+        for i in range(count)
+    ]
+
+
+def backup_dataset(bq, out_dir, tables=DATASET_TABLES, rows_per_shard=1_000_000, max_workers=8,
+                   **parquet_options):
+    os.makedirs(out_dir, exist_ok=True)
+
+    def export_shard(table_name, snapshot, index, start_index, max_results):
+        path = os.path.join(out_dir, f"{table_name}_{index:04d}.parquet")
+        rows = bq.export_table_shard_to_local_parquet(
+            table_name, path, start_index, max_results, source_table=snapshot, **parquet_options
+        )
+        return {"file": path, "rows": rows, "sha256": file_sha256(path)}
+
+    # Los shards se leen de un snapshot: con la tabla recibiendo inserts, los rangos
+    # por posición se desplazarían entre shards (filas duplicadas o perdidas)
+    snapshots = {}
+    try:
+        for table_name in tables:
+            snapshots[table_name] = bq.snapshot_table(table_name)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            for table_name, snapshot in snapshots.items():
+                num_rows = bq.table_num_rows(snapshot)
+                futures[table_name] = (num_rows, [
+                    pool.submit(export_shard, table_name, snapshot, i, start, size)
+                    for i, (start, size) in enumerate(plan_shards(num_rows, rows_per_shard))
+                ])
+            manifest_tables = {}
+            for table_name, (num_rows, shard_futures) in futures.items():
+                shards = [future.result() for future in shard_futures]
+                exported = sum(shard["rows"] for shard in shards)
+                if exported != num_rows:
+                    raise ValueError(f"{table_name}: se exportaron {exported} filas y el snapshot tiene {num_rows}")
+                manifest_tables[table_name] = {"rows": exported, "shards": shards}
+    finally:
+        for snapshot in snapshots.values():
+            bq.drop_table(snapshot)
+
+    manifest = {
+        "type": "dataset",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "tables": manifest_tables,
+    }
+    manifest["manifest_path"] = write_manifest(os.path.join(out_dir, "dataset.manifest.json"), manifest)
+    return manifest
+
+
+def restore_dataset(bq, manifest_path, tables=None, max_workers=8):
+    """Restaura en paralelo los shards de cada tabla; cada tabla solo se sustituye si todos
+    sus shards pasan el sha256 y cargan con las filas del manifest"""
+    manifest = read_manifest(manifest_path)
+    selected = {
+        name: entry for name, entry in manifest["tables"].items()
+        if tables is None or name in tables
+    }
+    # Los shards de cada tabla se cargan en paralelo en su staging: se reparten los workers
+    shard_workers = max(1, max_workers // max(1, len(selected)))
+
+    def restore_one(table_name, entry):
+        return bq.load_files_atomically(
+            table_name, entry["shards"], write_disposition="WRITE_TRUNCATE", max_workers=shard_workers
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, len(selected))) as table_pool:
+        futures = {name: table_pool.submit(restore_one, name, entry) for name, entry in selected.items()}
+        return {name: future.result() for name, future in futures.items()}
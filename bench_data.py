@@ -0,0 +1,108 @@
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+# Generador determinista de datos sintéticos para los benchmarks: CSV (sin header, como
+# los de /app/data) y payloads JSON de /ingest, con una proporción configurable de filas inválidas.
+#
+#   python bench_data.py --out /tmp/bench_data --rows 100000 --invalid-ratio 0.05
+
+N_DEPARTMENTS = 12
+N_JOBS = 183
+
+# Variantes de fila inválida: cada una dispara una regla distinta de validación
+INVALID_KINDS = ["missing", "bad_id", "bad_date", "orphan"]
+
+
+def _timestamp(rng):
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    ts = start + timedelta(seconds=rng.randrange(10 * 365 * 24 * 3600))
+    return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def dimension_rows(prefix, n, invalid_ratio=0.0, seed=42):
+    """Filas [id, name] de departments/jobs"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, n + 1):
+        row = [str(i), f"{prefix} {i}"]
+        if rng.random() < invalid_ratio:
+            row[rng.choice([0, 1])] = "" if rng.random() < 0.5 else "null"
+        rows.append(row)
+    return rows
+
+
+def hired_employee_rows(n, invalid_ratio=0.05, seed=42, start_id=1,
+                        n_departments=N_DEPARTMENTS, n_jobs=N_JOBS):
+    """Filas [id, name, datetime, department_id, job_id] de hired_employees"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(start_id, start_id + n):
+        row = [
+            str(i),
+            f"Employee {i}",
+            _timestamp(rng),
+            str(rng.randint(1, n_departments)),
+            str(rng.randint(1, n_jobs)),
+        ]
+        if rng.random() < invalid_ratio:
+            kind = rng.choice(INVALID_KINDS)
+            if kind == "missing":
+                row[rng.randrange(5)] = ""
+            elif kind == "bad_id":
+                row[rng.choice([0, 3, 4])] = "abc"
+            elif kind == "bad_date":
+                row[2] = "2021-13-45T99:00:00"
+            else:
+                row[3] = str(n_departments + 1000)
+        rows.append(row)
+    return rows
+
+
+def write_csvs(out_dir, rows=100_000, invalid_ratio=0.05, seed=42):
+    """Escribe departments.csv, jobs.csv y hired_employees.csv; devuelve {tabla: ruta}"""
+    os.makedirs(out_dir, exist_ok=True)
+    tables = {
+        "departments": dimension_rows("Department", N_DEPARTMENTS, seed=seed),
+        "jobs": dimension_rows("Job", N_JOBS, seed=seed + 1),
+        "hired_employees": hired_employee_rows(rows, invalid_ratio, seed=seed + 2),
+    }
+    paths = {}
+    for table, table_rows in tables.items():
+        paths[table] = os.path.join(out_dir, f"{table}.csv")
+        with open(paths[table], "w", newline="") as f:
+            csv.writer(f).writerows(table_rows)
+    return paths
+
+
+def ingest_payloads(n_payloads, records_per_payload=100, invalid_ratio=0.05, seed=42, start_id=1):
+    """Payloads {"table", "records"} de hired_employees para /ingest, con ids sin solapar"""
+    columns = ["id", "name", "datetime", "department_id", "job_id"]
+    payloads = []
+    for p in range(n_payloads):
+        rows = hired_employee_rows(
+            records_per_payload, invalid_ratio, seed=seed + p,
+            start_id=start_id + p * records_per_payload,
+        )
+        payloads.append({
+            "table": "hired_employees",
+            "records": [dict(zip(columns, row)) for row in rows],
+        })
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera CSV sintéticos para benchmarks")
+    parser.add_argument("--out", default="/tmp/bench_data")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--invalid-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    for table, path in write_csvs(args.out, args.rows, args.invalid_ratio, args.seed).items():
+        print(f"{table}: {path}")
+
+
+if __name__ == "__main__":
+    main()
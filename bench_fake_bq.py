@@ -0,0 +1,174 @@
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud.exceptions import NotFound
+
+from bq_client import BigQueryClient
+
+# BigQuery en memoria para los benchmarks: sustituye a google.cloud.bigquery.Client dentro de
+# un BigQueryClient real, registra cada llamada y simula la latencia de red y de carga.
+
+
+class FakeJob:
+    def __init__(self, result=None, output_rows=None, input_file_bytes=None):
+        self.job_id = uuid.uuid4().hex
+        self.total_bytes_processed = 0
+        self.slot_millis = 0
+        self.cache_hit = False
+        self.output_rows = output_rows
+        self.input_file_bytes = input_file_bytes
+        self._result = result
+
+    def result(self):
+        return self if self._result is None else self._result
+
+
+class FakeRowIterator:
+    def __init__(self, table, page_size=10_000):
+        self.table = table
+        self.page_size = page_size
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        yield from self.table.to_batches(max_chunksize=self.page_size)
+
+    def to_arrow(self, bqstorage_client=None):
+        return self.table
+
+
+class FakeTableInfo:
+    def __init__(self, num_rows):
+        self.num_rows = num_rows
+        self.time_partitioning = None
+        self.range_partitioning = None
+        self.clustering_fields = None
+
+
+def _table_id(table):
+    # Acepta "proyecto.dataset.tabla" o un bigquery.Table
+    if isinstance(table, str):
+        return table
+    return f"{table.project}.{table.dataset_id}.{table.table_id}"
+
+
+class InMemoryBigQuery:
+    """Sustituto en memoria de bigquery.Client con latencia simulada (por llamada y por MB)"""
+
+    def __init__(self, call_latency=0.05, mb_per_second=100.0):
+        self.call_latency = call_latency
+        self.mb_per_second = mb_per_second
+        self.tables = {}  # table_id -> lista de tablas de Arrow
+        self.calls = []
+        self._insert_ids = set()
+        self._lock = threading.Lock()
+
+    def _simulate(self, method, table=None, rows=0, nbytes=0):
+        seconds = self.call_latency + nbytes / (self.mb_per_second * 1024 * 1024)
+        time.sleep(seconds)
+        with self._lock:
+            self.calls.append({"method": method, "table": table, "rows": rows, "seconds": seconds})
+
+    def _read(self, table_id):
+        with self._lock:
+            if table_id not in self.tables:
+                raise NotFound(f"Not found: Table {table_id}")
+            parts = list(self.tables[table_id])
+        if not parts:
+            return pa.table({})
+        return pa.concat_tables(parts, promote_options="default")
+
+    def put(self, table_id, table, truncate=False):
+        with self._lock:
+            if truncate or table_id not in self.tables:
+                self.tables[table_id] = []
+            self.tables[table_id].append(table)
+
+    # --- API de bigquery.Client usada por BigQueryClient ---
+    def insert_rows_json(self, table, json_rows, row_ids=None, **kwargs):
+        table_id = _table_id(table)
+        rows = list(json_rows)
+        if row_ids is not None:
+            # Deduplicación por insertId, como el streaming de BigQuery
+            with self._lock:
+                keep = [i for i, row_id in enumerate(row_ids) if row_id not in self._insert_ids]
+                self._insert_ids.update(row_ids)
+            rows = [rows[i] for i in keep]
+        self._simulate("insert_rows_json", table_id, len(rows))
+        if rows:
+            self.put(table_id, pa.Table.from_pylist(rows))
+        return []
+
+    def query(self, query, job_config=None, **kwargs):
+        self._simulate("query")
+        return FakeJob(result=FakeRowIterator(pa.table({})))
+
+    def list_rows(self, table, selected_fields=None, max_results=None, start_index=None, page_size=None,
+                  **kwargs):
+        table_id = _table_id(table)
+        data = self._read(table_id)
+        if selected_fields and data.num_columns == 0:
+            # Tabla creada pero vacía: columnas pedidas sin filas
+            types = {"INT64": pa.int64(), "INTEGER": pa.int64()}
+            data = pa.table({f.name: pa.array([], types.get(f.field_type, pa.string())) for f in selected_fields})
+        elif selected_fields:
+            data = data.select([field.name for field in selected_fields])
+        start = start_index or 0
+        data = data.slice(start, max_results)
+        self._simulate("list_rows", table_id, data.num_rows, data.nbytes)
+        return FakeRowIterator(data, page_size or 10_000)
+
+    def get_table(self, table):
+        return FakeTableInfo(self._read(_table_id(table)).num_rows)
+
+    def create_table(self, table, exists_ok=False):
+        with self._lock:
+            self.tables.setdefault(_table_id(table), [])
+        return table
+
+    def delete_table(self, table, not_found_ok=False):
+        with self._lock:
+            self.tables.pop(_table_id(table), None)
+
+    def copy_table(self, source, destination, job_config=None, **kwargs):
+        truncate = job_config is None or job_config.write_disposition != "WRITE_APPEND"
+        self.put(_table_id(destination), self._read(_table_id(source)), truncate=truncate)
+        return FakeJob()
+
+    def load_table_from_file(self, file_obj, destination, job_config=None, **kwargs):
+        data = file_obj.read()
+        table = pq.read_table(pa.BufferReader(data))
+        table_id = _table_id(destination)
+        self._simulate("load_table_from_file", table_id, table.num_rows, len(data))
+        truncate = job_config is not None and job_config.write_disposition == "WRITE_TRUNCATE"
+        self.put(table_id, table, truncate=truncate)
+        return FakeJob(output_rows=table.num_rows, input_file_bytes=len(data))
+
+
+class FakeBigQueryClient(BigQueryClient):
+    """BigQueryClient real sobre InMemoryBigQuery: ejercita el mismo código que en producción"""
+
+    def __init__(self, call_latency=0.05, mb_per_second=100.0, project_id="bench", dataset="bench"):
+        super().__init__(project_id, dataset, client=InMemoryBigQuery(call_latency, mb_per_second))
+
+    def _bqstorage_client(self):
+        return None
+
+    def load_table(self, table_name, table):
+        """Carga datos iniciales sin latencia"""
+        self.client.put(self._table_path(table_name), table, truncate=True)
+
+    def rows(self, table_name):
+        return self.client._read(self._table_path(table_name))
+
+    def call_summary(self):
+        """Número de llamadas, filas y segundos simulados por método"""
+        summary = defaultdict(lambda: {"calls": 0, "rows": 0, "seconds": 0.0})
+        for call in self.client.calls:
+            entry = summary[call["method"]]
+            entry["calls"] += 1
+            entry["rows"] += call["rows"]
+            entry["seconds"] = round(entry["seconds"] + call["seconds"], 4)
+        return dict(summary)
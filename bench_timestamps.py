@@ -0,0 +1,42 @@
+import random
+import timeit
+from dateutil import parser
+from validation import parse_timestamp
+
+# Micro-benchmark: parse_timestamp (fromisoformat + memo) frente a parser.isoparse
+
+def make_samples(n=100000, distinct=20000, seed=42):
+    # Exportaciones reales: muchos timestamps repetidos y mezcla de formatos
+    rng = random.Random(seed)
+    formats = ["{}", "{}Z", "{}+00:00", "{}-05:00"]
+    values = [
+        rng.choice(formats).format(
+            f"20{rng.randint(0, 24):02d}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            f"T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+        )
+        for _ in range(distinct)
+    ]
+    return [rng.choice(values) for _ in range(n)]
+
+def isoparse_path(samples):
+    return [parser.isoparse(s).isoformat() for s in samples]
+
+def fast_path(samples):
+    return [parse_timestamp(s) for s in samples]
+
+def run_bench(n=100000, repeat=3):
+    samples = make_samples(n)
+    assert isoparse_path(samples) == fast_path(samples), "Los resultados no coinciden"
+
+    baseline = min(timeit.repeat(lambda: isoparse_path(samples), number=1, repeat=repeat))
+    parse_timestamp.cache_clear()
+    fast = min(timeit.repeat(lambda: fast_path(samples), number=1, repeat=repeat))
+    parse_timestamp.cache_clear()
+    cold = min(timeit.repeat(lambda: (parse_timestamp.cache_clear(), fast_path(samples)), number=1, repeat=repeat))
+
+    print(f"isoparse:                {n / baseline:>12,.0f} filas/s")
+    print(f"parse_timestamp (frío):  {n / cold:>12,.0f} filas/s  ({baseline / cold:.1f}x)")
+    print(f"parse_timestamp (caché): {n / fast:>12,.0f} filas/s  ({baseline / fast:.1f}x)")
+
+if __name__ == "__main__":
+    run_bench()
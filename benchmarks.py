@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+
+# api.py lee el API key al importarse
+os.environ.setdefault("API_KEY", "bench")
+
+from bench_data import hired_employee_rows, ingest_payloads, write_csvs
+from bench_fake_bq import FakeBigQueryClient
+from dimensions import DimensionCache
+from pk_index import PrimaryKeyIndexes
+from validation import validate_hired_employees, validate_hired_employees_df
+
+# Suite de benchmarks sin BigQuery: validadores, process_csv, /ingest con concurrencia y
+# backup/restore, sobre FakeBigQueryClient (latencia simulada). Escribe los resultados en JSON
+# y, con --baseline, falla si algún throughput cae más de --tolerance respecto a una ejecución previa.
+#
+#   python benchmarks.py --rows 200000 --output bench_results.json
+#   python benchmarks.py --baseline bench_results.json --only validators process_csv
+
+HIRED_COLUMNS = ["id", "name", "datetime", "department_id", "job_id"]
+BENCHMARKS = ["validators", "process_csv", "ingest", "backup_restore"]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+
+def bind_state(module, fake):
+    # Apunta el módulo (api o etl_historico) al cliente falso con índices y cachés nuevos
+    module.bq = fake
+    module.pk_indexes = PrimaryKeyIndexes(lambda table: fake.primary_keys(table))
+    module.dimensions = DimensionCache(lambda table: fake.dimension_names(table))
+
+
+def seed_dimensions(fake, paths):
+    for table in ["departments", "jobs"]:
+        df = pd.read_csv(paths[table], header=None, names=["id", "name"], dtype=str).dropna()
+        fake.load_table(table, pa.table({"id": df["id"].astype("int64"), "name": df["name"]}))
+
+
+# ------------------
+# Benchmarks
+# ------------------
+def bench_validators(paths, row_sample=20_000):
+    # Validación de hired_employees con los tamaños de chunk reales del ETL, frente al bucle
+    # original (iterrows + validador por fila sobre chunks de CHUNK_SIZE)
+    import etl_historico as etl
+    from csv_reader import read_csv_batches
+
+    csv_path = paths["hired_employees"]
+    df = pd.read_csv(csv_path, header=None, names=HIRED_COLUMNS, dtype=str)
+    sample = df.head(row_sample)
+
+    def iterrows_loop():
+        for start in range(0, len(sample), etl.CHUNK_SIZE):
+            for _, row in sample.iloc[start:start + etl.CHUNK_SIZE].iterrows():
+                validate_hired_employees(row.to_dict())
+
+    _, iterrows_seconds = timed(iterrows_loop)
+    # Lector pandas (ETL_CSV_READER=pandas): chunks fijos de CHUNK_SIZE filas
+    chunks = [df.iloc[i:i + etl.CHUNK_SIZE] for i in range(0, len(df), etl.CHUNK_SIZE)]
+    _, pandas_seconds = timed(lambda: [validate_hired_employees_df(chunk) for chunk in chunks])
+    # Lector arrow (por defecto): chunks según ETL_READ_MEMORY_MB
+    arrow_chunks = list(read_csv_batches(csv_path, HIRED_COLUMNS, memory_budget=etl.READ_MEMORY_MB * 1024 * 1024))
+    _, arrow_seconds = timed(lambda: [validate_hired_employees_df(chunk) for chunk in arrow_chunks])
+
+    iterrows_rate = rate(len(sample), iterrows_seconds)
+    pandas_rate = rate(len(df), pandas_seconds)
+    arrow_rate = rate(len(df), arrow_seconds)
+    return {
+        "rows": len(df),
+        "iterrows_rows_per_s": iterrows_rate,
+        "vectorized_chunk_rows": etl.CHUNK_SIZE,
+        "vectorized_rows_per_s": pandas_rate,
+        "vectorized_arrow_chunk_rows": max(len(chunk) for chunk in arrow_chunks),
+        "vectorized_arrow_rows_per_s": arrow_rate,
+        "speedup_vs_iterrows": round(pandas_rate / iterrows_rate, 1),
+        "speedup_arrow_vs_iterrows": round(arrow_rate / iterrows_rate, 1),
+    }
+
+
+def bench_process_csv(paths, call_latency, workers):
+    import etl_historico as etl
+    from checkpoints import CheckpointStore
+
+    results = {}
+    table = "hired_employees"
+    for mode, parallel in [("stream", False), ("stream", True), ("bulk", False)]:
+        fake = FakeBigQueryClient(call_latency=call_latency)
+        seed_dimensions(fake, paths)
+        bind_state(etl, fake)
+        with tempfile.TemporaryDirectory() as tmp:
+            sink = etl.ParquetSink(table, out_dir=tmp) if mode == "bulk" else None
+            if parallel:
+                for name in etl.tables_config:
+                    etl.tables_config[name]["csv"] = paths[name]
+                # Solo hired_employees: las dimensiones ya están en el cliente falso
+                config = {table: etl.tables_config[table]}
+                original, etl.tables_config = etl.tables_config, config
+                try:
+                    stats, seconds = timed(
+                        lambda: etl.run_parallel(workers, mode, CheckpointStore(os.path.join(tmp, "state.json")))[table]
+                    )
+                finally:
+                    etl.tables_config = original
+            else:
+                stats, seconds = timed(
+                    lambda: etl.process_csv(table, paths[table], validate_hired_employees_df, sink)
+                )
+        name = f"{mode}_parallel_{workers}" if parallel else mode
+        results[name] = {
+            **stats,
+            "seconds": round(seconds, 3),
+            "rows_per_s": rate(stats["rows"], seconds),
+            "bigquery_calls": fake.call_summary(),
+        }
+    return results
+
+
+def bench_ingest(paths, call_latency, levels, requests_per_level, records_per_request, invalid_ratio):
+    import api
+
+    results = {}
+    next_id = 10_000_000
+    for concurrency in levels:
+        fake = FakeBigQueryClient(call_latency=call_latency)
+        seed_dimensions(fake, paths)
+        bind_state(api, fake)
+        api.analytics_cache.clear()
+        payloads = ingest_payloads(
+            requests_per_level, records_per_request, invalid_ratio, seed=concurrency, start_id=next_id
+        )
+        next_id += requests_per_level * records_per_request
+
+        def send(payload):
+            client = api.app.test_client()
+            start = time.perf_counter()
+            response = client.post("/ingest", json=payload, headers={"x-api-key": os.environ["API_KEY"]})
+            return time.perf_counter() - start, response.status_code, response.get_json().get("inserted", 0)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            responses, seconds = timed(lambda: list(pool.map(send, payloads)))
+        latencies = sorted(latency for latency, _, _ in responses)
+        results[f"concurrency_{concurrency}"] = {
+            "requests": len(responses),
+            "errors": sum(1 for _, status, _ in responses if status >= 500),
+            "inserted": sum(inserted for _, _, inserted in responses),
+            "requests_per_s": rate(len(responses), seconds),
+            "records_per_s": rate(len(responses) * records_per_request, seconds),
+            "latency_ms": {
+                "mean": round(statistics.mean(latencies) * 1000, 2),
+                "p50": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p95": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+                "p99": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+            },
+        }
+    return results
+
+
+def bench_backup_restore(rows, call_latency, mb_per_second, rows_per_shard, workers):
+    from backups import backup_dataset, restore_dataset
+
+    fake = FakeBigQueryClient(call_latency=call_latency, mb_per_second=mb_per_second)
+    df = pd.DataFrame(hired_employee_rows(rows, invalid_ratio=0.0), columns=HIRED_COLUMNS)
+    fake.load_table("hired_employees", pa.table({
+        "id": df["id"].astype("int64"),
+        "name": df["name"],
+        "hired_timestamp": pd.to_datetime(df["datetime"], utc=True),
+        "department_id": df["department_id"].astype("int64"),
+        "job_id": df["job_id"].astype("int64"),
+    }))
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest, backup_seconds = timed(lambda: backup_dataset(
+            fake, tmp, tables=["hired_employees"], rows_per_shard=rows_per_shard, max_workers=workers
+        ))
+        shards = manifest["tables"]["hired_employees"]["shards"]
+        nbytes = sum(os.path.getsize(shard["file"]) for shard in shards)
+        _, restore_seconds = timed(lambda: restore_dataset(fake, manifest["manifest_path"], max_workers=workers))
+    restored = fake.rows("hired_employees").num_rows
+    mb = nbytes / (1024 * 1024)
+    return {
+        "rows": rows,
+        "shards": len(shards),
+        "file_mb": round(mb, 2),
+        "restored_rows": restored,
+        "backup": {"seconds": round(backup_seconds, 3), "rows_per_s": rate(rows, backup_seconds),
+                   "mb_per_s": rate(mb, backup_seconds)},
+        "restore": {"seconds": round(restore_seconds, 3), "rows_per_s": rate(rows, restore_seconds),
+                    "mb_per_s": rate(mb, restore_seconds)},
+    }
+
+
+# ------------------
+# Comparación con una ejecución anterior
+# ------------------
+def throughputs(results, prefix=""):
+    """Aplana las métricas de throughput (claves terminadas en _per_s)"""
+    found = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            found.update(throughputs(value, f"{path}."))
+        elif key.endswith("_per_s") and value:
+            found[path] = value
+    return found
+
+
+def find_regressions(baseline, current, tolerance):
+    previous = throughputs(baseline)
+    regressions = []
+    for path, value in throughputs(current).items():
+        if path in previous and value < previous[path] * (1 - tolerance):
+            regressions.append({"metric": path, "baseline": previous[path], "current": value,
+                                "change": round(value / previous[path] - 1, 3)})
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks de la PoC sin BigQuery real")
+    parser.add_argument("--rows", type=int, default=100_000, help="Filas de hired_employees generadas")
+    parser.add_argument("--invalid-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latencia simulada por llamada (s)")
+    parser.add_argument("--mb-per-second", type=float, default=100.0, help="Ancho de banda simulado de cargas")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="Requests de /ingest por nivel")
+    parser.add_argument("--records-per-request", type=int, default=100)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Caída de throughput tolerada (0.2 = 20%%)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        paths = write_csvs(data_dir, args.rows, args.invalid_ratio, args.seed)
+        if "validators" in args.only:
+            results["validators"] = bench_validators(paths)
+        if "process_csv" in args.only:
+            results["process_csv"] = bench_process_csv(paths, args.latency, args.workers)
+        if "ingest" in args.only:
+            results["ingest"] = bench_ingest(
+                paths, args.latency, args.concurrency, args.requests, args.records_per_request, args.invalid_ratio
+            )
+        if "backup_restore" in args.only:
+            results["backup_restore"] = bench_backup_restore(
+                args.rows, args.latency, args.mb_per_second, max(1, args.rows // args.workers), args.workers
+            )
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(json.load(f)["results"], results, args.tolerance)
+        report["regressions"] = regressions
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(results, indent=2))
+    print(f"Resultados en {args.output}")
+    for regression in regressions:
+        print(f"⚠️ Regresión en {regression['metric']}: {regression['baseline']} → {regression['current']}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,571 @@
 from google.cloud import bigquery
+from google.cloud.exceptions import BadRequest, NotFound, ServerError, TooManyRequests
 from google.oauth2 import service_account
+import atexit
 import json
-from datetime import datetime
+import hashlib
+from datetime import datetime, timedelta, timezone
 from google.cloud import storage
 import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.compute as pc
+import requests
+from metrics import (
+    BYTES_EXPORTED, BYTES_RESTORED, DLQ_ROWS, INSERT_ERRORS, INSERT_RETRIES, QUERIES, QUERIES_OVER_BUDGET,
+    QUERY_BYTES_PROCESSED, QUERY_SLOT_MS, ROWS_INSERTED, instrument_methods
+)
+
+try:
+    from google.cloud import bigquery_storage
+except ImportError:
+    bigquery_storage = None
+
+# Tabla resumen de contrataciones (año, trimestre, departamento, cargo)
+SUMMARY_TABLE = "hiring_summary"
+SUMMARY_SCHEMA = [
+    bigquery.SchemaField("year", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("quarter", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("department_id", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("job_id", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("hired", "INT64", mode="REQUIRED"),
+]
+
+# Esquema de hired_employees (se usa solo si la tabla no existe)
+HIRED_SCHEMA = [
+    bigquery.SchemaField("id", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("name", "STRING"),
+    bigquery.SchemaField("hired_timestamp", "TIMESTAMP"),
+    bigquery.SchemaField("department_id", "INT64"),
+    bigquery.SchemaField("job_id", "INT64"),
+]
+
+# Layout físico por tabla: particionado + clustering. hired_employees se particiona por mes de
+# contratación y el resumen por año, así los filtros por rango de fechas/año podan particiones
+TABLE_LAYOUTS = {
+    "hired_employees": {
+        "time_partitioning": bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.MONTH, field="hired_timestamp"
+        ),
+        "clustering_fields": ["department_id", "job_id"],
+        "ddl": "PARTITION BY TIMESTAMP_TRUNC(hired_timestamp, MONTH) CLUSTER BY department_id, job_id",
+    },
+    SUMMARY_TABLE: {
+        "range_partitioning": bigquery.RangePartitioning(
+            field="year", range_=bigquery.PartitionRange(start=1900, end=2101, interval=1)
+        ),
+        "clustering_fields": ["department_id", "job_id"],
+        "ddl": "PARTITION BY RANGE_BUCKET(year, GENERATE_ARRAY(1900, 2101, 1)) CLUSTER BY department_id, job_id",
+    },
+}
+TABLE_SCHEMAS = {"hired_employees": HIRED_SCHEMA}
+
+# Filtro de un año sobre hired_employees como rango semiabierto [1 ene @year, 1 ene @year + 1):
+# sin funciones sobre la columna, para que BigQuery pueda podar particiones
+HIRED_YEAR_FILTER = (
+    "h.hired_timestamp >= TIMESTAMP(DATE(@year, 1, 1)) "
+    "AND h.hired_timestamp < TIMESTAMP(DATE(@year + 1, 1, 1))"
+)
+
+
+def layout_matches(table, layout):
+    """Indica si una tabla de BigQuery ya tiene el particionado y clustering esperados"""
+    if "time_partitioning" in layout:
+        expected = layout["time_partitioning"]
+        current = table.time_partitioning
+        if current is None or (current.field, current.type_) != (expected.field, expected.type_):
+            return False
+    if "range_partitioning" in layout:
+        current = table.range_partitioning
+        if current is None or current.field != layout["range_partitioning"].field:
+            return False
+    return list(table.clustering_fields or []) == layout["clustering_fields"]
+
+
+def apply_layout(config, layout):
+    """Copia particionado y clustering del layout a una Table o LoadJobConfig"""
+    for attr in ("time_partitioning", "range_partitioning", "clustering_fields"):
+        if attr in layout:
+            setattr(config, attr, layout[attr])
+    return config
+
+# Clave primaria por tabla para derivar los insertId de los streaming inserts
+PRIMARY_KEYS = {"departments": "id", "jobs": "id", "hired_employees": "id"}
+
+
+def insert_ids(table, rows):
+    """insertId deterministas por fila; None (IDs aleatorios) si la tabla no tiene clave primaria"""
+    key = PRIMARY_KEYS.get(table)
+    if key is None:
+        return None
+    return [f"{table}:{row[key]}" for row in rows]
+
+
+# Errores de fila que no se arreglan reenviando (p. ej. tipo incorrecto); el resto
+# ("stopped", "backendError", "timeout"...) se reintenta
+PERMANENT_INSERT_ERRORS = {"invalid", "invalidQuery", "notFound", "accessDenied"}
+
+# Fallos de la petición entera que se reintentan: cuota (429), 5xx y red. El resto
+# (400, 403, 404...) se repetiría igual y las filas van directamente a la DLQ
+RETRYABLE_REQUEST_ERRORS = (
+    TooManyRequests, ServerError, ConnectionError, TimeoutError,
+    requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+)
+
+# Bytes que añade cada fila a la petición además de su JSON (insertId y estructura)
+INSERT_ROW_OVERHEAD = 64
+
+
+def split_batches(rows, row_ids, max_rows, max_bytes):
+    """Índices de las filas agrupados en lotes de como mucho max_rows filas y max_bytes de JSON"""
+    batches, current, size = [], [], 0
+    for i, row in enumerate(rows):
+        row_bytes = len(json.dumps(row, default=str)) + INSERT_ROW_OVERHEAD
+        if row_ids is not None:
+            row_bytes += len(row_ids[i])
+        if current and (len(current) >= max_rows or size + row_bytes > max_bytes):
+            batches.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += row_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+
+def backoff_delay(attempt, base, cap=30.0):
+    """Espera antes del reintento `attempt` (1, 2, ...): exponencial con jitter completo"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def insert_error_message(errors):
+    return "; ".join(f"{e.get('reason')}: {e.get('message')}" for e in errors) or "error desconocido"
+
+
+def summarize_hires(rows):
+    """Agrega filas validadas de hired_employees por año, trimestre, departamento y cargo;
+    devuelve (deltas, insertId de cada delta)"""
+    df = pd.DataFrame(rows, columns=["id", "hired_timestamp", "department_id", "job_id"])
+    # Igual que DATE(hired_timestamp) en BigQuery: fecha en UTC
+    ts = pd.to_datetime(df["hired_timestamp"], utc=True, format="ISO8601")
+    groups = df.assign(year=ts.dt.year, quarter=ts.dt.quarter).groupby(
+        ["year", "quarter", "department_id", "job_id"]
+    )["id"]
+    summary = groups.size().reset_index(name="hired")
+    # El insertId depende de los ids que suma cada delta: reenviar las mismas filas
+    # (reintento, ETL reanudado) repite el insertId y BigQuery lo descarta
+    digests = groups.agg(lambda ids: hashlib.sha1(",".join(sorted(map(str, ids))).encode()).hexdigest()[:16])
+    row_ids = [
+        f"{SUMMARY_TABLE}:{year}:{quarter}:{department_id}:{job_id}:{digest}"
+        for (year, quarter, department_id, job_id), digest in digests.items()
+    ]
+    return summary.to_dict("records"), row_ids
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DLQBuffer:
+    """Acumula registros inválidos y los envía a la DLQ en bloque (thread-safe)"""
+
+    def __init__(self, send, max_rows=500, max_bytes=5 * 1024 * 1024, max_seconds=5.0):
+        self.send = send
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self._rows = []
+        self._bytes = 0
+        self._first_at = None
+        self._timer = None
+        self._lock = threading.Lock()
+        # Lo pendiente al salir del proceso también se envía
+        atexit.register(self.flush)
+
+    def add(self, row):
+        size = len(json.dumps(row))
+        with self._lock:
+            if not self._rows:
+                self._first_at = time.monotonic()
+                # Sin más registros que lleguen, el temporizador envía el bloque a los max_seconds
+                self._timer = threading.Timer(self.max_seconds, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+            self._rows.append(row)
+            self._bytes += size
+            full = (
+                len(self._rows) >= self.max_rows
+                or self._bytes >= self.max_bytes
+                or time.monotonic() - self._first_at >= self.max_seconds
+            )
+        if full:
+            self.flush()
+
+    def flush(self):
+        # Saca los registros pendientes bajo el lock y los envía fuera de él
+        with self._lock:
+            rows, self._rows, self._bytes, self._first_at = self._rows, [], 0, None
+            timer, self._timer = self._timer, None
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+        if rows:
+            self.send(rows)
+        return len(rows)
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"⚠️ Error enviando la DLQ en segundo plano: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rows)
+
 
 class BigQueryClient:
-    def __init__(self, project_id, dataset, credentials_path=None):
-        if credentials_path:
+    def __init__(self, project_id, dataset, credentials_path=None, client=None):
+        creds = None
+        if client is not None:
+            # Cliente ya construido (p. ej. el de memoria de los benchmarks)
+            self.client = client
+        elif credentials_path:
             creds = service_account.Credentials.from_service_account_file(credentials_path)
             self.client = bigquery.Client(project=project_id, credentials=creds)
         else:
             self.client = bigquery.Client(project=project_id)
+        self._credentials = creds
+        self._bqstorage = None
 
         self.project_id = project_id
         self.dataset = dataset
+        self._summary_ready = False
+        # Deltas del resumen en curso y reconstrucción: una reconstrucción espera a que terminen
+        # los deltas y los nuevos esperan a que acabe (CREATE OR REPLACE perdería los que lleguen entre medias)
+        self._summary_cond = threading.Condition()
+        self._summary_deltas = 0
+        self._summary_rebuilding = False
+        # Presupuesto de bytes por consulta (0 = sin límite) y precio on-demand para estimar coste
+        self.query_bytes_budget = int(os.getenv("QUERY_BYTES_BUDGET", "0"))
+        self.usd_per_tib = float(os.getenv("BQ_USD_PER_TIB", "6.25"))
+        self.dlq_buffer = DLQBuffer(
+            self._send_dlq_rows,
+            max_rows=int(os.getenv("DLQ_MAX_ROWS", "500")),
+            max_bytes=int(os.getenv("DLQ_MAX_BYTES", str(5 * 1024 * 1024))),
+            max_seconds=float(os.getenv("DLQ_MAX_SECONDS", "5")),
+        )
+        # Streaming inserts: lotes por filas y bytes (límite de 10 MB por petición), enviados
+        # en paralelo y con reintentos solo de las filas que fallan
+        self.insert_max_rows = int(os.getenv("INSERT_MAX_ROWS", "500"))
+        self.insert_max_bytes = int(os.getenv("INSERT_MAX_BYTES", str(9 * 1024 * 1024)))
+        self.insert_max_retries = int(os.getenv("INSERT_MAX_RETRIES", "5"))
+        self.insert_backoff = float(os.getenv("INSERT_BACKOFF_SECONDS", "0.5"))
+        self._insert_pool = ThreadPoolExecutor(max_workers=int(os.getenv("INSERT_WORKERS", "4")))
 
     def _table_path(self, table_name: str) -> str:
         """Devuelve el path completo project.dataset.table"""
         return f"{self.project_id}.{self.dataset}.{table_name}"
 
-    def insert_rows(self, table, rows):
+    def query_to_arrow(self, query, job_config=None, name="query"):
+        """Ejecuta una consulta y devuelve el resultado como tabla de Arrow"""
+        start = time.perf_counter()
+        job = self.client.query(query, job_config=job_config)
+        table = job.result().to_arrow()
+        self._record_query_stats(name, job, time.perf_counter() - start)
+        return table
+
+    def _record_query_stats(self, name, job, elapsed):
+        # Bytes procesados, slots, caché y tiempo de cada job; aviso si supera el presupuesto
+        bytes_processed = job.total_bytes_processed or 0
+        slot_millis = job.slot_millis or 0
+        cache_hit = bool(job.cache_hit)
+        QUERY_BYTES_PROCESSED.labels(name).observe(bytes_processed)
+        QUERY_SLOT_MS.labels(name).inc(slot_millis)
+        QUERIES.labels(name, str(cache_hit).lower()).inc()
+        print(
+            f"Consulta {name} (job {job.job_id}): {bytes_processed} bytes, {slot_millis} slot-ms, "
+            f"cache_hit={cache_hit}, {elapsed:.2f}s"
+        )
+        if self.query_bytes_budget and bytes_processed > self.query_bytes_budget:
+            QUERIES_OVER_BUDGET.labels(name).inc()
+            print(f"⚠️ Consulta {name} supera el presupuesto: {bytes_processed} > {self.query_bytes_budget} bytes")
+
+    def dry_run_query(self, query, job_config=None):
+        """Estima bytes y coste de una consulta sin ejecutarla"""
+        params = job_config.query_parameters if job_config else []
+        dry_config = bigquery.QueryJobConfig(query_parameters=params, dry_run=True, use_query_cache=False)
+        job = self.client.query(query, job_config=dry_config)
+        bytes_processed = job.total_bytes_processed or 0
+        return {
+            "dry_run": True,
+            "total_bytes_processed": bytes_processed,
+            "estimated_cost_usd": round(bytes_processed / 2 ** 40 * self.usd_per_tib, 6),
+            "over_budget": bool(self.query_bytes_budget and bytes_processed > self.query_bytes_budget),
+        }
+
+    def insert_rows(self, table, rows, row_ids=None):
+        """Inserta filas en streaming; devuelve cuántas se insertaron (las que fallan van a la DLQ)"""
+        inserted, _ = self.insert_rows_with_failures(table, rows, row_ids)
+        return inserted
+
+    def insert_rows_with_failures(self, table, rows, row_ids=None):
+        """Como insert_rows, pero devuelve también los índices (ordenados) de las filas que fallaron"""
+        if not rows:
+            return 0, []
         table_id = self._table_path(table)
-        errors = self.client.insert_rows_json(table_id, rows)
-        if errors:
-            print(f"Errores insertando en {table}: {errors}")
+        # IDs deterministas (tabla + clave primaria): BigQuery descarta los reintentos duplicados.
+        # Sin clave primaria se deja que la librería genere IDs aleatorios
+        if row_ids is None:
+            row_ids = insert_ids(table, rows)
+        batches = split_batches(rows, row_ids, self.insert_max_rows, self.insert_max_bytes)
+        if len(batches) == 1:
+            results = [self._insert_batch(table, table_id, rows, row_ids, batches[0])]
+        else:
+            futures = [
+                self._insert_pool.submit(self._insert_batch, table, table_id, rows, row_ids, batch)
+                for batch in batches
+            ]
+            results = [future.result() for future in futures]
+        failed = {index: error for result in results for index, error in result.items()}
+        inserted = len(rows) - len(failed)
+        ROWS_INSERTED.labels(table).inc(inserted)
+        if failed:
+            INSERT_ERRORS.labels(table).inc(len(failed))
+            print(f"Errores insertando en {table}: {len(failed)} filas enviadas a la DLQ")
+            for index in sorted(failed):
+                self.insert_dlq(table, rows[index], failed[index])
+            self.flush_dlq()
+        print(f"Insertados {inserted} registros en {table}")
+        return inserted, sorted(failed)
+
+    def _insert_batch(self, table, table_id, rows, row_ids, indexes):
+        # Envía un lote y reenvía solo las filas con error reintentable (backoff con jitter);
+        # devuelve {índice: error} de las que no se pudieron insertar
+        failed = {}
+        pending = indexes
+        for attempt in range(self.insert_max_retries + 1):
+            if attempt:
+                INSERT_RETRIES.labels(table).inc(len(pending))
+                time.sleep(backoff_delay(attempt, self.insert_backoff))
+            batch_rows = [rows[i] for i in pending]
+            try:
+                if row_ids is None:
+                    errors = self.client.insert_rows_json(table_id, batch_rows)
+                else:
+                    errors = self.client.insert_rows_json(
+                        table_id, batch_rows, row_ids=[row_ids[i] for i in pending]
+                    )
+            except Exception as e:
+                # Fallo de la petición entera: se reintenta todo el lote solo si es transitorio
+                reason = "request" if isinstance(e, RETRYABLE_REQUEST_ERRORS) else "invalid"
+                errors = [{"index": position, "errors": [{"reason": reason, "message": str(e)}]}
+                          for position in range(len(pending))]
+            errored, retry = {}, []
+            for error in errors:
+                index = pending[error["index"]]
+                details = error.get("errors", [])
+                errored[index] = insert_error_message(details)
+                if not {e.get("reason") for e in details} & PERMANENT_INSERT_ERRORS:
+                    retry.append(index)
+            # Cada fila se queda con el resultado de su último intento
+            for index in pending:
+                failed.pop(index, None)
+            failed.update(errored)
+            if not retry:
+                break
+            pending = retry
+        return failed
+
+
+    # ------------------
+    # Resumen de contrataciones: se mantiene con inserts incrementales (deltas) y se
+    # puede reconstruir (y compactar) desde hired_employees
+    # ------------------
+    def ensure_hiring_summary(self):
+        """Si el resumen no existe lo construye desde hired_employees; devuelve True si lo reconstruyó"""
+        if self._summary_ready:
+            return False
+        try:
+            self.client.get_table(self._table_path(SUMMARY_TABLE))
+        except NotFound:
+            # Crearlo vacío dejaría fuera el histórico: se construye completo
+            self.rebuild_hiring_summary()
+            return True
+        self._summary_ready = True
+        return False
+
+    def update_hiring_summary(self, hired_rows):
+        deltas, row_ids = summarize_hires(hired_rows)
+        if not deltas:
+            return 0
+        # Las filas ya están en hired_employees: si hubo que reconstruir el resumen, ya las incluye
+        if self.ensure_hiring_summary():
+            return len(deltas)
+        with self._summary_cond:
+            while self._summary_rebuilding:
+                self._summary_cond.wait()
+            self._summary_deltas += 1
+        try:
+            return self.insert_rows(SUMMARY_TABLE, deltas, row_ids=row_ids)
+        finally:
+            with self._summary_cond:
+                self._summary_deltas -= 1
+                self._summary_cond.notify_all()
+
+    def rebuild_hiring_summary(self):
+        # Serializado con los deltas de este proceso; los que envíe otro proceso mientras
+        # corre (p. ej. el ETL con la API) se pierden: reconstruir con la carga parada
+        with self._summary_cond:
+            while self._summary_rebuilding or self._summary_deltas:
+                self._summary_cond.wait()
+            self._summary_rebuilding = True
+        try:
+            return self._rebuild_hiring_summary()
+        finally:
+            with self._summary_cond:
+                self._summary_rebuilding = False
+                self._summary_cond.notify_all()
+
+    def _rebuild_hiring_summary(self):
+        query = f"""
+        CREATE OR REPLACE TABLE `{self._table_path(SUMMARY_TABLE)}`
+        {TABLE_LAYOUTS[SUMMARY_TABLE]["ddl"]}
+        AS
+        SELECT
+            EXTRACT(YEAR FROM DATE(hired_timestamp)) AS year,
+            EXTRACT(QUARTER FROM DATE(hired_timestamp)) AS quarter,
+            department_id,
+            job_id,
+            COUNT(*) AS hired
+        FROM `{self._table_path("hired_employees")}`
+        GROUP BY year, quarter, department_id, job_id
+        """
+        job = self.client.query(query)
+        job.result()
+        self._summary_ready = True
+        print(f"Reconstruido {SUMMARY_TABLE} desde hired_employees")
+        return job
+
+    # ------------------
+    # Gestión de esquema: crea las tablas con su layout; las existentes solo se migran
+    # cuando se pide explícitamente (POST /schema/migrate, etl_historico.py --migrate)
+    # ------------------
+    def ensure_table_layout(self, table_name, migrate=False):
+        """Crea la tabla particionada/agrupada si no existe y, con migrate, migra la existente;
+        devuelve created/migrated/needs_migration/ok"""
+        layout = TABLE_LAYOUTS[table_name]
+        table_ref = self._table_path(table_name)
+        try:
+            table = self.client.get_table(table_ref)
+        except NotFound:
+            if table_name == SUMMARY_TABLE:
+                # El resumen se crea ya poblado desde hired_employees
+                self.rebuild_hiring_summary()
+            else:
+                table = bigquery.Table(table_ref, schema=TABLE_SCHEMAS[table_name])
+                self.client.create_table(apply_layout(table, layout))
+            print(f"Creada {table_ref} ({layout['ddl']})")
+            return "created"
+        if layout_matches(table, layout):
+            return "ok"
+        if not migrate:
+            print(f"⚠️ {table_ref} sin particionado: ejecuta la migración de esquema (POST /schema/migrate)")
+            return "needs_migration"
+        if table_name == SUMMARY_TABLE:
+            # El resumen es derivado: se borra y se reconstruye ya particionado
+            self.client.delete_table(table_ref)
+            self.rebuild_hiring_summary()
         else:
-            print(f"Insertados {len(rows)} registros en {table}")
-        return 0 if errors else len(rows)
+            self._migrate_table_layout(table_name, layout)
+        print(f"Migrada {table_ref} ({layout['ddl']})")
+        return "migrated"
 
+    def _migrate_table_layout(self, table_name, layout):
+        # Un solo statement: la tabla se reemplaza de forma atómica con el layout nuevo
+        table_ref = self._table_path(table_name)
+        try:
+            self.client.query(
+                f"CREATE OR REPLACE TABLE `{table_ref}` {layout['ddl']} AS SELECT * FROM `{table_ref}`"
+            ).result()
+            return
+        except BadRequest as e:
+            # BigQuery rechaza CREATE OR REPLACE si cambia el particionado (p. ej. de ninguno a mensual)
+            if "partitioning" not in str(e):
+                raise
+        self._migrate_table_layout_via_copy(table_name, layout)
+
+    def _migrate_table_layout_via_copy(self, table_name, layout):
+        # La copia con el layout nuevo se crea y se verifica antes de borrar la original;
+        # si algo falla después, la copia se conserva para poder recuperar la tabla
+        table_ref = self._table_path(table_name)
+        tmp_ref = self._table_path(f"{table_name}__layout_tmp")
+        self.client.query(
+            f"CREATE OR REPLACE TABLE `{tmp_ref}` {layout['ddl']} AS SELECT * FROM `{table_ref}`"
+        ).result()
+        expected = self.client.get_table(table_ref).num_rows
+        if self.client.get_table(tmp_ref).num_rows != expected:
+            self.client.delete_table(tmp_ref, not_found_ok=True)
+            raise ValueError(f"La copia de {table_ref} con el layout nuevo no tiene {expected} filas")
+        try:
+            self.client.delete_table(table_ref)
+            self.client.copy_table(tmp_ref, table_ref).result()
+        except Exception as e:
+            raise RuntimeError(f"Migración de {table_ref} incompleta: los datos están en {tmp_ref}") from e
+        self.client.delete_table(tmp_ref)
+
+    def ensure_schema(self, migrate=False):
+        """Crea las tablas gestionadas que falten (primero hired_employees, luego el resumen);
+        con migrate también migra las que tengan el layout antiguo"""
+        return {table_name: self.ensure_table_layout(table_name, migrate) for table_name in TABLE_LAYOUTS}
+
+    def _load_layout(self, job_config, table_name, write_disposition):
+        # En restores que sobrescriben la tabla se conserva/crea su layout; si la tabla aún
+        # tiene el layout antiguo se carga sin él (BigQuery rechaza cambiar el particionado)
+        layout = TABLE_LAYOUTS.get(table_name)
+        if layout is None or write_disposition != "WRITE_TRUNCATE":
+            return
+        try:
+            table = self.client.get_table(self._table_path(table_name))
+        except NotFound:
+            table = None
+        if table is None or layout_matches(table, layout):
+            apply_layout(job_config, layout)
+        else:
+            print(f"⚠️ {table_name} sin particionado: ejecuta la migración de esquema (POST /schema/migrate)")
 
     def insert_dlq(self, table_name, raw_row, error_reason):
-        #Guarda registros inválidos en la tabla DLQ
-        table_id = self._table_path("dlq")
+        #Encola registros inválidos para la tabla DLQ (se envían en bloque)
         row = {
             "table_name": table_name,
             "row_data": json.dumps(raw_row),
             "error": error_reason,
             "inserted_at": datetime.utcnow().isoformat()
         }
-        errors = self.client.insert_rows_json(table_id, [row])
+        self.dlq_buffer.add(row)
+        DLQ_ROWS.labels(table_name).inc()
+
+    def flush_dlq(self):
+        # Envía a la DLQ todo lo pendiente; llamar al final de cada request o carga ETL
+        return self.dlq_buffer.flush()
+
+    def _send_dlq_rows(self, rows):
+        table_id = self._table_path("dlq")
+        errors = self.client.insert_rows_json(table_id, rows)
         if errors:
+            INSERT_ERRORS.labels("dlq").inc(len(rows))
             print(f"Error insertando en DLQ: {errors}")
         else:
-            print(f"Registro inválido enviado a DLQ")
+            print(f"{len(rows)} registros inválidos enviados a DLQ")
 
     def export_table_to_gcs(self, table_name: str, gcs_uri: str, file_format: str = "PARQUET"):
         table_ref = f"{self.project_id}.{self.dataset}.{table_name}"
@@ -64,16 +586,145 @@ class BigQueryClient:
         return extract_job
 
     # ------------------
-    # Exportar tabla a fichero local (usa query y escribe Parquet en local)
+    # Exportar tabla a fichero local en streaming: lee record batches de Arrow (Storage
+    # Read API si está disponible) y los escribe por row groups con ParquetWriter, así
+    # la memoria depende del tamaño del row group y no del de la tabla
     # ------------------
-    def export_table_to_local_parquet(self, table_name: str, local_path: str):
-        query = f"SELECT * FROM `{self.project_id}.{self.dataset}.{table_name}`"
-        df = self.client.query(query).result().to_dataframe(create_bqstorage_client=True)
-        # guardar parquet con pyarrow
-        df.to_parquet(local_path, index=False)
-        print(f"✅ Exportado {table_name} a {local_path}")
+    def export_table_to_local_parquet(self, table_name: str, local_path: str,
+                                      row_group_size: int = 100_000, compression: str = "snappy"):
+        rows = self.client.list_rows(self._table_path(table_name))
+        total, _ = self._write_parquet_stream(table_name, rows, local_path, row_group_size, compression)
+        print(f"✅ Exportado {table_name} a {local_path} ({total} filas)")
         return local_path
 
+    # ------------------
+    # Exportar solo las filas posteriores a una marca de agua (backups incrementales)
+    # Devuelve (filas exportadas, nueva marca de agua)
+    # ------------------
+    def export_table_delta_to_local_parquet(self, table_name: str, local_path: str, watermark_column: str,
+                                            after=None, watermark_type: str = "INT64",
+                                            row_group_size: int = 100_000, compression: str = "snappy"):
+        if after is None:
+            rows = self.client.list_rows(self._table_path(table_name))
+        else:
+            # Con TIMESTAMP la columna se convierte (la DLQ guarda inserted_at como texto ISO)
+            column = watermark_column if watermark_type == "INT64" else f"CAST({watermark_column} AS TIMESTAMP)"
+            query = f"SELECT * FROM `{self._table_path(table_name)}` WHERE {column} > @after"
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ScalarQueryParameter("after", watermark_type, after)]
+            )
+            rows = self.client.query(query, job_config=job_config).result()
+        total, watermark = self._write_parquet_stream(
+            table_name, rows, local_path, row_group_size, compression, watermark_column
+        )
+        print(f"✅ Exportado delta de {table_name} ({watermark_column} > {after}) a {local_path} ({total} filas)")
+        return total, watermark if watermark is not None else after
+
+    # ------------------
+    # Exportar un rango de filas (shard) con tabledata.list, sin coste de consulta.
+    # La Storage Read API ignora start_index: los shards se leen siempre por REST y con
+    # max_results explícito. source_table permite leer de un snapshot de table_name
+    # ------------------
+    def export_table_shard_to_local_parquet(self, table_name: str, local_path: str, start_index: int,
+                                            max_results: int, source_table=None,
+                                            row_group_size: int = 100_000, compression: str = "snappy"):
+        rows = self.client.list_rows(
+            self._table_path(source_table or table_name), start_index=start_index, max_results=max_results
+        )
+        total, _ = self._write_parquet_stream(
+            table_name, rows, local_path, row_group_size, compression, use_storage_api=False
+        )
+        print(f"✅ Exportado shard de {table_name} (desde fila {start_index}) a {local_path} ({total} filas)")
+        return total
+
+    def table_num_rows(self, table_name: str) -> int:
+        return self.client.get_table(self._table_path(table_name)).num_rows or 0
+
+    def snapshot_table(self, table_name: str, expiration_hours: int = 24) -> str:
+        """Crea un snapshot de table_name (inmutable, caduca solo) y devuelve su nombre"""
+        snapshot_name = f"{table_name}__snapshot_{uuid.uuid4().hex[:12]}"
+        job_config = bigquery.CopyJobConfig(
+            operation_type=bigquery.job.OperationType.SNAPSHOT,
+            destination_expiration_time=datetime.now(timezone.utc) + timedelta(hours=expiration_hours),
+        )
+        self.client.copy_table(
+            self._table_path(table_name), self._table_path(snapshot_name), job_config=job_config
+        ).result()
+        return snapshot_name
+
+    def drop_table(self, table_name: str):
+        self.client.delete_table(self._table_path(table_name), not_found_ok=True)
+
+    def _write_parquet_stream(self, table_name, rows, local_path, row_group_size, compression,
+                              watermark_column=None, use_storage_api=True):
+        # Escribe los record batches por row groups; calcula de paso el máximo de la marca de agua
+        writer, pending, pending_rows, total, watermark = None, [], 0, 0, None
+
+        def write_pending():
+            writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_size)
+
+        try:
+            bqstorage_client = self._bqstorage_client() if use_storage_api else None
+            for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client):
+                if writer is None:
+                    writer = pq.ParquetWriter(local_path, batch.schema, compression=compression)
+                if watermark_column and batch.num_rows:
+                    batch_max = pc.max(batch.column(watermark_column)).as_py()
+                    if batch_max is not None and (watermark is None or batch_max > watermark):
+                        watermark = batch_max
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                total += batch.num_rows
+                if pending_rows >= row_group_size:
+                    write_pending()
+                    pending, pending_rows = [], 0
+            if writer is None:
+                # Sin filas: se escribe solo el esquema
+                empty = self.client.list_rows(self._table_path(table_name), max_results=0).to_arrow()
+                pq.write_table(empty, local_path, compression=compression)
+            elif pending:
+                write_pending()
+        finally:
+            if writer is not None:
+                writer.close()
+        BYTES_EXPORTED.labels(table_name).inc(os.path.getsize(local_path))
+        return total, watermark
+
+    def primary_keys(self, table_name: str):
+        """Lee la columna de clave primaria completa (sin consulta: list_rows + Storage API)"""
+        column = PRIMARY_KEYS[table_name]
+        try:
+            rows = self.client.list_rows(
+                self._table_path(table_name), selected_fields=[bigquery.SchemaField(column, "INT64")]
+            )
+            batches = list(rows.to_arrow_iterable(bqstorage_client=self._bqstorage_client()))
+        except NotFound:
+            return np.empty(0, dtype=np.int64)
+        if not batches:
+            return np.empty(0, dtype=np.int64)
+        keys = pa.Table.from_batches(batches).column(column).drop_null()
+        return keys.to_numpy().astype(np.int64, copy=False)
+
+    def dimension_names(self, table_name: str):
+        """Diccionario id -> name de una tabla de dimensión (lectura directa, sin consulta)"""
+        try:
+            rows = self.client.list_rows(
+                self._table_path(table_name),
+                selected_fields=[bigquery.SchemaField("id", "INT64"), bigquery.SchemaField("name", "STRING")],
+            )
+            table = rows.to_arrow(bqstorage_client=self._bqstorage_client())
+        except NotFound:
+            return {}
+        return dict(zip(table.column("id").to_pylist(), table.column("name").to_pylist()))
+
+    def _bqstorage_client(self):
+        # Cliente de la Storage Read API (opcional); sin él se leen páginas por REST
+        if bigquery_storage is None:
+            return None
+        if self._bqstorage is None:
+            self._bqstorage = bigquery_storage.BigQueryReadClient(credentials=self._credentials)
+        return self._bqstorage
+
     # ------------------
     # Restaurar desde GCS Parquet/Avro
     # ------------------
@@ -86,15 +737,18 @@ class BigQueryClient:
             job_config.source_format = bigquery.SourceFormat.AVRO
 
         job_config.write_disposition = write_disposition  # overwrite by default
+        self._load_layout(job_config, table_name, write_disposition)
         load_job = self.client.load_table_from_uri(gcs_uri, table_ref, job_config=job_config)
         load_job.result()
+        BYTES_RESTORED.labels(table_name).inc(load_job.input_file_bytes or 0)
         print(f"Restaurado {table_ref} desde {gcs_uri}")
         return load_job
 
     # ------------------
     # Restaurar desde fichero local Parquet/Avro (sube temporalmente a GCS o carga direct desde file)
     # ------------------
-    def restore_table_from_local_file(self, table_name: str, local_file_path: str, source_format: str = "PARQUET", write_disposition="WRITE_TRUNCATE"):
+    def restore_table_from_local_file(self, table_name: str, local_file_path: str, source_format: str = "PARQUET", write_disposition="WRITE_TRUNCATE",
+                                      expected_sha256=None):
         table_ref = f"{self.project_id}.{self.dataset}.{table_name}"
         job_config = bigquery.LoadJobConfig()
         if source_format.upper() == "PARQUET":
@@ -103,9 +757,120 @@ class BigQueryClient:
             job_config.source_format = bigquery.SourceFormat.AVRO
 
         job_config.write_disposition = write_disposition
+        self._load_layout(job_config, table_name, write_disposition)
 
+        # El checksum se comprueba antes de lanzar la carga (con WRITE_TRUNCATE ya no habría vuelta atrás)
+        if expected_sha256 and file_sha256(local_file_path) != expected_sha256:
+            raise ValueError(f"Checksum de {local_file_path} no coincide con el del manifest")
         with open(local_file_path, "rb") as f:
             load_job = self.client.load_table_from_file(f, table_ref, job_config=job_config)
             load_job.result()
+        BYTES_RESTORED.labels(table_name).inc(os.path.getsize(local_file_path))
         print(f"Restaurado {table_ref} desde archivo local {local_file_path}")
         return load_job
+
+    # ------------------
+    # Carga atómica de varios ficheros: o se cargan todos o la tabla no cambia
+    # ------------------
+    def load_files_atomically(self, table_name, files, write_disposition="WRITE_APPEND", source_format="PARQUET",
+                              gcs_prefix=None, max_workers=8):
+        """
+        Carga varios ficheros locales en table_name con un único commit. files es una lista de
+        rutas o de {"file", "rows", "sha256"}; filas y sha256 (si se indican) se verifican antes
+        de tocar la tabla. Con gcs_prefix (gs://bucket/ruta) se suben a GCS y se cargan en un
+        solo load job; si no, se cargan en una tabla de staging que se copia con un copy job.
+        """
+        files = [{"file": f} if isinstance(f, str) else f for f in files]
+        for entry in files:
+            if entry.get("sha256") and file_sha256(entry["file"]) != entry["sha256"]:
+                raise ValueError(f"Checksum de {entry['file']} no coincide con el del manifest")
+        if gcs_prefix:
+            return self._load_files_from_gcs(table_name, files, write_disposition, source_format, gcs_prefix)
+        return self._load_files_via_staging(table_name, files, write_disposition, source_format, max_workers)
+
+    def _load_files_from_gcs(self, table_name, files, write_disposition, source_format, gcs_prefix):
+        bucket_name, _, prefix = gcs_prefix[len("gs://"):].partition("/")
+        bucket = storage.Client(project=self.project_id, credentials=self._credentials).bucket(bucket_name)
+        run_prefix = f"{prefix.strip('/')}/{table_name}_{uuid.uuid4().hex}".lstrip("/")
+        blobs = []
+        try:
+            for entry in files:
+                blob = bucket.blob(f"{run_prefix}/{os.path.basename(entry['file'])}")
+                blob.upload_from_filename(entry["file"])
+                blobs.append(blob)
+            uris = [f"gs://{bucket_name}/{blob.name}" for blob in blobs]
+            job = self.restore_table_from_gcs(table_name, uris, source_format, write_disposition)
+            self._check_loaded_rows(job, files)
+            return [job]
+        finally:
+            for blob in blobs:
+                blob.delete()
+
+    def _load_files_via_staging(self, table_name, files, write_disposition, source_format, max_workers):
+        # La tabla de staging se crea con el layout de la tabla final para que el copy job sea válido
+        staging_name = f"{table_name}__staging_{uuid.uuid4().hex[:12]}"
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET if source_format.upper() == "PARQUET"
+            else bigquery.SourceFormat.AVRO
+        )
+        self._load_layout(job_config, table_name, "WRITE_TRUNCATE")
+        staging_ref = self._table_path(staging_name)
+
+        def load(entry, disposition):
+            config = bigquery.LoadJobConfig.from_api_repr(job_config.to_api_repr())
+            config.write_disposition = disposition
+            with open(entry["file"], "rb") as f:
+                job = self.client.load_table_from_file(f, staging_ref, job_config=config)
+                job.result()
+            self._check_loaded_rows(job, [entry])
+            BYTES_RESTORED.labels(table_name).inc(os.path.getsize(entry["file"]))
+            return job
+
+        try:
+            # El primer fichero crea la tabla de staging; el resto se añade en paralelo
+            jobs = [load(files[0], "WRITE_TRUNCATE")]
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                jobs.extend(pool.map(lambda entry: load(entry, "WRITE_APPEND"), files[1:]))
+            copy_config = bigquery.CopyJobConfig(write_disposition=write_disposition)
+            self.client.copy_table(staging_ref, self._table_path(table_name), job_config=copy_config).result()
+        finally:
+            self.client.delete_table(staging_ref, not_found_ok=True)
+        print(f"Cargados {len(files)} ficheros en {self._table_path(table_name)} ({write_disposition})")
+        return jobs
+
+    @staticmethod
+    def _check_loaded_rows(job, files):
+        expected = [entry.get("rows") for entry in files]
+        loaded = getattr(job, "output_rows", None)
+        if loaded is not None and None not in expected and loaded != sum(expected):
+            names = ", ".join(entry["file"] for entry in files)
+            raise ValueError(f"{names}: se cargaron {loaded} filas y el manifest indica {sum(expected)}")
+
+
+# Latencia y errores de cada método público
+instrument_methods(BigQueryClient)
+
+
+class LazyBigQueryClient:
+    """Crea el BigQueryClient en el primer uso dentro de cada proceso.
+
+    Con servidores que hacen fork (gunicorn) cada worker tiene su propio cliente y
+    sus propias conexiones; los hilos de un mismo worker comparten el cliente.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = self._factory()
+                    self._pid = os.getpid()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+class ResultCache:
+    """Caché LRU en memoria con TTL, límite de tamaño e invalidación por tabla"""
+
+    def __init__(self, ttl_seconds=300, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size, expires_at, tables)
+        self._bytes = 0
+        # Generación por tabla: cada invalidación la incrementa
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def generation(self, tables):
+        """Marca de las tablas a tomar antes de lanzar la consulta (para pasarla a set)"""
+        with self._lock:
+            return tuple(self._generations[table] for table in tables)
+
+    def set(self, key, value, tables=(), ttl=None, generation=None):
+        # `tables`: tablas de las que depende el resultado (para invalidar al escribir).
+        # `generation`: si alguna tabla se invalidó desde entonces, el resultado ya es viejo y no se guarda
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations[table] for table in tables):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at, frozenset(tables))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_table(self, table):
+        # Elimina solo las entradas que dependen de la tabla escrita
+        with self._lock:
+            self._generations[table] += 1
+            for key in [k for k, entry in self._entries.items() if table in entry[3]]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import sys
+
+from google.cloud import bigquery
+
+from bq_client import BigQueryClient, HIRED_YEAR_FILTER, SUMMARY_TABLE
+
+# Compara (con dry runs, sin coste) los bytes que procesa una consulta por año sobre
+# hired_employees con el filtro antiguo (función sobre la columna, no poda particiones)
+# frente al rango semiabierto, y la consulta equivalente sobre el resumen particionado.
+#
+#   python check_pruning.py --years 2021 2022 --migrate
+
+PROJECT_ID = "migracionpoc"
+DATASET = "migration_poc"
+
+LEGACY_FILTER = "EXTRACT(YEAR FROM DATE(h.hired_timestamp)) = @year"
+
+
+def hired_query(where):
+    return f"""
+    SELECT h.department_id, h.job_id, COUNT(*) AS hired
+    FROM `{PROJECT_ID}.{DATASET}.hired_employees` h
+    WHERE {where}
+    GROUP BY h.department_id, h.job_id
+    """
+
+
+SUMMARY_QUERY = f"""
+SELECT s.department_id, s.job_id, SUM(s.hired) AS hired
+FROM `{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}` s
+WHERE s.year = @year
+GROUP BY s.department_id, s.job_id
+"""
+
+
+def check_year(bq, year):
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("year", "INT64", year)]
+    )
+    before = bq.dry_run_query(hired_query(LEGACY_FILTER), job_config)["total_bytes_processed"]
+    after = bq.dry_run_query(hired_query(HIRED_YEAR_FILTER), job_config)["total_bytes_processed"]
+    summary = bq.dry_run_query(SUMMARY_QUERY, job_config)["total_bytes_processed"]
+    return {
+        "year": year,
+        "bytes_before": before,
+        "bytes_after": after,
+        "bytes_summary": summary,
+        "pruned": before == 0 or after < before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica la poda de particiones por año")
+    parser.add_argument("--years", type=int, nargs="+", required=True)
+    parser.add_argument("--migrate", action="store_true", help="Ejecuta antes la migración de esquema")
+    args = parser.parse_args()
+
+    bq = BigQueryClient(PROJECT_ID, DATASET, credentials_path=os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
+    if args.migrate:
+        print(json.dumps({"schema": bq.ensure_schema(migrate=True)}))
+    results = [check_year(bq, year) for year in args.years]
+    print(json.dumps(results, indent=2))
+    # Con datos de varios años, el filtro semiabierto debe procesar menos bytes que el antiguo
+    sys.exit(0 if all(r["pruned"] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+
+
+class CheckpointStore:
+    """Fichero JSON local con el progreso del ETL por CSV (escritura atómica, thread-safe)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            with open(path) as f:
+                self._state = json.load(f)
+        except FileNotFoundError:
+            self._state = {}
+
+    def get(self, csv_path):
+        with self._lock:
+            return dict(self._state.get(csv_path, {}))
+
+    def put(self, csv_path, entry):
+        with self._lock:
+            self._state[csv_path] = entry
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._state, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def reset(self):
+        with self._lock:
+            self._state = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class CsvCheckpoint:
+    """Progreso de un CSV: filas confirmadas (prefijo contiguo de chunks) y estadísticas acumuladas"""
+
+    def __init__(self, store, csv_path, every=20, on_save=None):
+        self.store = store
+        self.csv_path = csv_path
+        self.every = every
+        # on_save: se llama antes de guardar (p. ej. para vaciar el buffer de la DLQ)
+        self.on_save = on_save
+        stat = os.stat(csv_path)
+        self._fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime}
+        entry = store.get(csv_path)
+        if entry and entry.get("fingerprint") != self._fingerprint:
+            print(f"⚠️ {csv_path} cambió desde el último checkpoint: se procesa desde el inicio")
+            entry = {}
+        self.done = entry.get("done", False)
+        # Estadísticas acumuladas de los chunks confirmados
+        self.stats = dict(entry.get("stats", {}))
+        # Se reanuda por filas (el tamaño de los chunks puede cambiar entre ejecuciones);
+        # los índices de chunk de esta ejecución empiezan en 0
+        self.start_row = self.stats.get("rows", 0)
+        self._next = 0
+        self._pending = {}
+        self._since_save = 0
+        self._lock = threading.Lock()
+
+    def chunk_done(self, index, chunk_stats):
+        # Los chunks pueden terminar fuera de orden (modo paralelo): solo se avanza
+        # hasta el primer hueco para no saltar chunks pendientes al reanudar
+        with self._lock:
+            self._pending[index] = chunk_stats
+            while self._next in self._pending:
+                for key, value in self._pending.pop(self._next).items():
+                    self.stats[key] = self.stats.get(key, 0) + value
+                self._next += 1
+                self._since_save += 1
+            if self._since_save >= self.every:
+                self._since_save = 0
+                self._save(done=False)
+
+    def finish(self):
+        with self._lock:
+            self._save(done=True)
+
+    def _save(self, done):
+        if self.on_save is not None:
+            self.on_save()
+        self.store.put(self.csv_path, {
+            "fingerprint": self._fingerprint,
+            "rows": self.stats.get("rows", 0),
+            "done": done,
+            "stats": self.stats,
+        })
@@ -0,0 +1,165 @@
+import csv
+import queue
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+# Lector de CSV en streaming con pyarrow: una sola pasada por el fichero (el header se
+# detecta con peek sobre el mismo buffer), todas las columnas como string y chunks de
+# tamaño adaptado a un presupuesto de memoria en lugar de un número fijo de filas.
+
+# Los mismos valores nulos que pandas.read_csv por defecto (los validadores cuentan con ellos)
+NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+# Bytes que se miran (sin consumirlos) para detectar el header
+HEADER_PEEK_BYTES = 1 << 20
+
+# La validación crea varias columnas intermedias por chunk: el presupuesto por chunk
+# se divide entre este factor para no pasarse del total
+VALIDATION_OVERHEAD = 4
+
+MIN_CHUNK_ROWS = 1000
+
+_STRING = pd.StringDtype("pyarrow")
+
+
+def sniff_header(f, expected_cols):
+    """Columnas de la primera línea si es un header válido (None si son datos); no consume el fichero"""
+    first_line = f.peek(HEADER_PEEK_BYTES).split(b"\n", 1)[0]
+    # utf-8-sig: los CSV exportados desde Excel empiezan con BOM
+    fields = next(csv.reader([first_line.decode("utf-8-sig", errors="replace").rstrip("\r")]), [])
+    return fields if set(expected_cols).issubset(fields) else None
+
+
+def chunk_rows(nbytes, num_rows, chunk_bytes):
+    """Filas por chunk para que ocupe unos chunk_bytes, según el tamaño medio de fila observado"""
+    if not num_rows:
+        return MIN_CHUNK_ROWS
+    return max(MIN_CHUNK_ROWS, int(chunk_bytes * num_rows / max(nbytes, 1)))
+
+
+def _to_pandas(table, offset):
+    df = table.to_pandas(types_mapper={pa.string(): _STRING}.get)
+    # Índice continuo entre chunks, como en pandas.read_csv(chunksize=...)
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    return df
+
+
+def _invalid_row_handler(on_invalid_row):
+    # Filas con más o menos columnas de las esperadas: se notifican y se omiten en lugar de
+    # abortar la lectura. Arrow puede llamarlo desde sus hilos de parseo
+    def handle(row):
+        on_invalid_row(
+            {"line": row.number, "text": row.text},
+            f"Número de columnas incorrecto: {row.actual_columns} (se esperaban {row.expected_columns})",
+        )
+        return "skip"
+    return handle
+
+
+def _batches(csv_path, expected_cols, skip_rows, block_size, on_invalid_row=None):
+    with open(csv_path, "rb", buffering=HEADER_PEEK_BYTES) as f:
+        header = sniff_header(f, expected_cols)
+        names = header or expected_cols
+        read_options = pacsv.ReadOptions(
+            use_threads=True,
+            block_size=block_size,
+            # Con header, arrow toma los nombres de la primera línea
+            column_names=None if header else names,
+            skip_rows_after_names=skip_rows,
+        )
+        # Valores entre comillas con saltos de línea (p. ej. nombres): una fila puede ocupar
+        # varias líneas y skip_rows cuenta filas, no líneas
+        parse_options = pacsv.ParseOptions(
+            newlines_in_values=True,
+            invalid_row_handler=_invalid_row_handler(on_invalid_row) if on_invalid_row else None,
+        )
+        convert_options = pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in names},
+            strings_can_be_null=True,
+            null_values=NULL_VALUES,
+        )
+        reader = pacsv.open_csv(
+            f, read_options=read_options, parse_options=parse_options, convert_options=convert_options
+        )
+        for batch in reader:
+            if batch.num_rows:
+                yield batch
+
+
+def read_csv_batches(csv_path, expected_cols, memory_budget=256 * 1024 * 1024, in_flight=1, skip_rows=0,
+                     on_invalid_row=None):
+    """
+    DataFrames de strings del CSV en una sola pasada. Cada chunk ocupa aproximadamente
+    memory_budget / in_flight (con margen para la validación), donde in_flight es el número
+    de chunks que el consumidor puede tener a la vez en memoria. skip_rows omite las
+    primeras filas de datos (para reanudar desde un checkpoint).
+    on_invalid_row(registro, error) recibe las filas con un número de columnas incorrecto,
+    que no aparecen en los chunks; sin él, una fila así aborta la lectura.
+    """
+    chunk_bytes = max(memory_budget // (max(in_flight, 1) * VALIDATION_OVERHEAD), 1)
+    # Bloques de lectura menores que un chunk para que el tamaño se ajuste pronto
+    block_size = min(max(chunk_bytes // 4, 1 << 20), 64 << 20)
+    pending, pending_rows = [], 0
+    offset = skip_rows
+    for batch in _batches(csv_path, expected_cols, skip_rows, block_size, on_invalid_row):
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        # Se recalcula con cada bloque: se adapta al ancho real de las filas
+        target = chunk_rows(batch.nbytes, batch.num_rows, chunk_bytes)
+        while pending_rows >= target:
+            table = pa.Table.from_batches(pending)
+            yield _to_pandas(table.slice(0, target), offset)
+            offset += target
+            rest = table.slice(target)
+            pending, pending_rows = rest.to_batches(), rest.num_rows
+    if pending_rows:
+        yield _to_pandas(pa.Table.from_batches(pending), offset)
+
+
+def prefetch(iterable, depth=1):
+    """Genera los elementos de iterable produciéndolos en un hilo aparte (hasta depth por adelantado)"""
+    # pyarrow libera el GIL al parsear: la lectura del siguiente chunk se solapa
+    # con la validación e inserción del actual
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Espera con timeout para no quedarse bloqueado si el consumidor ya paró
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # El consumidor pudo parar antes de tiempo (error o break): se libera el hilo
+        stop.set()
+        thread.join()
@@ -7,6 +7,7 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import os
 from datetime import datetime
+from dashboard_data import DashboardData
 
 # --- Configuración de la página ---
 st.set_page_config(
@@ -81,14 +82,17 @@ def get_available_years():
     except:
         return list(range(1993, 2025))
 
-@st.cache_data(ttl=300)
+@st.cache_resource
+def get_data_layer():
+    """Capa de datos compartida entre reruns (sesión HTTP y resultados en memoria)"""
+    return DashboardData(API_URL, HEADERS, ttl_seconds=300)
+
+data_layer = get_data_layer()
+
 def get_hired_by_quarter(year):
     """Obtiene datos de contrataciones por trimestre"""
-    url = f"{API_URL}/analytics/hired_by_quarter/{year}"
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=10)
-        resp.raise_for_status()
-        return pd.DataFrame(resp.json())
+        return data_layer.load_year(year)["hired_by_quarter"].result()
     except requests.exceptions.RequestException as e:
         st.error(f"Error de conexión: {e}")
         return pd.DataFrame()
@@ -96,14 +100,10 @@ def get_hired_by_quarter(year):
         st.error(f"Error al obtener datos de contrataciones: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
 def get_departments_above_average(year):
     """Obtiene departamentos con contrataciones sobre el promedio"""
-    url = f"{API_URL}/analytics/departments_above_average/{year}"
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=10)
-        resp.raise_for_status()
-        return pd.DataFrame(resp.json())
+        return data_layer.load_year(year)["departments_above_average"].result()
     except requests.exceptions.RequestException as e:
         st.error(f"Error de conexión: {e}")
         return pd.DataFrame()
@@ -111,6 +111,20 @@ def get_departments_above_average(year):
         st.error(f"Error al obtener datos de departamentos: {e}")
         return pd.DataFrame()
 
+def get_hiring_trend(from_year, to_year):
+    """Contrataciones por año y trimestre para todo el rango (una sola consulta)"""
+    try:
+        df = data_layer.load_range(from_year, to_year)["hired_by_quarter"].result()
+        if df.empty:
+            return df
+        return df.groupby("year")[["Q1", "Q2", "Q3", "Q4"]].sum().reset_index()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error de conexión: {e}")
+        return pd.DataFrame()
+    except Exception as e:
+        st.error(f"Error al obtener la tendencia de contrataciones: {e}")
+        return pd.DataFrame()
+
 def create_quarterly_chart(df, year):
     """Crea gráfico de contrataciones por trimestre"""
     if df.empty:
@@ -282,6 +296,7 @@ with st.sidebar:
     # Botón para actualizar datos
     if st.button("🔄 Actualizar Datos", type="primary"):
         st.cache_data.clear()
+        data_layer.clear()
         st.rerun()
     
     st.markdown("""
@@ -296,6 +311,13 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
 
+# --- Carga de datos ---
+# Todas las consultas del año se lanzan a la vez; los años vecinos se precargan en segundo plano
+data_layer.load_year(year)
+data_layer.prefetch([y for y in (year - 1, year + 1) if y in available_years])
+# Una petición para todos los años: deja la caché por año lista para el selector
+data_layer.load_range(available_years[0], available_years[-1])
+
 # --- Contenido Principal ---
 col1, col2, col3 = st.columns([1, 2, 1])
 with col2:
@@ -307,7 +329,7 @@ with col2:
     """, unsafe_allow_html=True)
 
 # Tabs para organizar contenido
-tab1, tab2, tab3 = st.tabs(["📈 Por Trimestres", "🏆 Sobre Promedio", "🔍 Vista Detallada"])
+tab1, tab2, tab3, tab4 = st.tabs(["📈 Por Trimestres", "🏆 Sobre Promedio", "🔍 Vista Detallada", "📅 Tendencia Anual"])
 
 with tab1:
     st.markdown("### 📊 Contrataciones por Trimestre")
@@ -381,7 +403,7 @@ with tab2:
 with tab3:
     st.markdown("### 🔍 Análisis Detallado")
     
-    df_quarters_detail = get_hired_by_quarter(year)
+    df_quarters_detail = df_quarters
     
     if not df_quarters_detail.empty:
         # Vista por departamento
@@ -441,6 +463,29 @@ with tab3:
             fig_pie.update_layout(height=400)
             st.plotly_chart(fig_pie, use_container_width=True)
 
+with tab4:
+    st.markdown("### 📅 Tendencia de Contrataciones por Año")
+
+    with st.spinner("Cargando tendencia de todos los años..."):
+        df_trend_years = get_hiring_trend(available_years[0], available_years[-1])
+
+    if not df_trend_years.empty:
+        df_trend_years["Total"] = df_trend_years[["Q1", "Q2", "Q3", "Q4"]].sum(axis=1)
+        fig_years = px.line(
+            df_trend_years,
+            x="year",
+            y=["Total", "Q1", "Q2", "Q3", "Q4"],
+            markers=True,
+            labels={"year": "Año", "value": "Contrataciones", "variable": "Serie"}
+        )
+        fig_years.update_layout(
+            title="📅 Contrataciones por Año y Trimestre",
+            height=500
+        )
+        st.plotly_chart(fig_years, use_container_width=True)
+    else:
+        st.info("ℹ️ No hay datos de contrataciones para el rango de años")
+
 # --- Footer ---
 st.markdown("---")
 st.markdown("""
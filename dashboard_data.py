@@ -0,0 +1,113 @@
+# dashboard_data.py
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import requests
+from requests.adapters import HTTPAdapter
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# Endpoints de analytics que usa el dashboard para cada año
+DATASETS = {
+    "hired_by_quarter": "/analytics/hired_by_quarter/{year}",
+    "departments_above_average": "/analytics/departments_above_average/{year}",
+}
+RANGE_DATASETS = {
+    "hired_by_quarter": "/analytics/hired_by_quarter/{from_year}/{to_year}",
+    "departments_above_average": "/analytics/departments_above_average/{from_year}/{to_year}",
+}
+
+
+class DashboardData:
+    """Capa de datos del dashboard: sesión HTTP con keep-alive, peticiones en paralelo,
+    deduplicación de peticiones en vuelo y precarga de años en segundo plano"""
+
+    def __init__(self, api_url, headers, ttl_seconds=300, max_workers=8, timeout=10):
+        self.api_url = api_url
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dashboard-fetch")
+        self._futures = {}  # path -> (Future, momento en que se completó o None)
+        self._lock = threading.Lock()
+
+    def fetch(self, path, on_done=None):
+        """Devuelve un Future con el DataFrame; reutiliza peticiones en vuelo y resultados recientes.
+        on_done se registra solo cuando se lanza una petición nueva (no en cada rerun de Streamlit)"""
+        with self._lock:
+            entry = self._futures.get(path)
+            if entry is not None:
+                future, done_at = entry
+                fresh = done_at is None or time.monotonic() - done_at < self.ttl_seconds
+                if fresh and not (future.done() and future.exception()):
+                    return future
+            future = self._executor.submit(self._get, path)
+            self._futures[path] = (future, None)
+        future.add_done_callback(lambda f: self._mark_done(path, f))
+        if on_done is not None:
+            future.add_done_callback(on_done)
+        return future
+
+    def _mark_done(self, path, future):
+        with self._lock:
+            entry = self._futures.get(path)
+            if entry is not None and entry[0] is future:
+                self._futures[path] = (future, time.monotonic())
+
+    def _get(self, path):
+        # Se pide Arrow IPC; si la API responde JSON (versiones anteriores) también se acepta
+        resp = self.session.get(
+            f"{self.api_url}{path}",
+            headers={"Accept": f"{ARROW_STREAM}, application/json;q=0.5"},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        if resp.headers.get("Content-Type", "").startswith(ARROW_STREAM):
+            return pa.ipc.open_stream(resp.content).read_all().to_pandas()
+        return pd.DataFrame(resp.json())
+
+    def load_year(self, year):
+        """Lanza en paralelo todas las consultas del año; devuelve {dataset: Future}"""
+        return {name: self.fetch(path.format(year=year)) for name, path in DATASETS.items()}
+
+    def load_range(self, from_year, to_year):
+        """Una sola petición por dataset para todo el rango; el resultado se reparte por año
+        para que cambiar de año en el selector no vuelva a llamar a la API"""
+        futures = {}
+        for name, path in RANGE_DATASETS.items():
+            futures[name] = self.fetch(
+                path.format(from_year=from_year, to_year=to_year),
+                on_done=lambda f, name=name: self._split_by_year(name, f, from_year, to_year),
+            )
+        return futures
+
+    def _split_by_year(self, name, future, from_year, to_year):
+        if future.exception() is not None:
+            return
+        df = future.result()
+        now = time.monotonic()
+        with self._lock:
+            for year in range(from_year, to_year + 1):
+                if df.empty:
+                    part = pd.DataFrame()
+                else:
+                    part = df[df["year"] == year].drop(columns="year").reset_index(drop=True)
+                done = Future()
+                done.set_result(part)
+                self._futures[DATASETS[name].format(year=year)] = (done, now)
+
+    def prefetch(self, years):
+        # Sin esperar: los resultados quedan listos para cuando se seleccione el año
+        for year in years:
+            self.load_year(year)
+
+    def clear(self):
+        with self._lock:
+            self._futures.clear()
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pandas as pd
+
+# Tablas de dimensiones y claves foráneas que apuntan a ellas
+DIMENSION_TABLES = ("departments", "jobs")
+FOREIGN_KEYS = {
+    "hired_employees": {"department_id": "departments", "job_id": "jobs"},
+}
+
+
+class DimensionUnavailable(RuntimeError):
+    """No se pudo cargar una dimensión desde BigQuery (no es un error de los datos)"""
+
+
+class DimensionCache:
+    """Ids y nombres de las dimensiones en memoria para validar claves foráneas sin consultar BigQuery"""
+
+    def __init__(self, loader, reload_seconds=30.0):
+        # loader(table) -> dict {id: nombre} con el contenido actual de la tabla
+        self.loader = loader
+        # Ante un id desconocido se recarga la tabla (las filas pueden venir de otro proceso),
+        # como mucho una vez cada reload_seconds
+        self.reload_seconds = reload_seconds
+        self._names = {}
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+
+    def names(self, table):
+        """Diccionario id -> nombre; se carga en bloque la primera vez"""
+        with self._lock:
+            names = self._names.get(table)
+            if names is None:
+                names = self._load(table, {})
+                print(f"Caché de {table} cargada ({len(names)} ids)")
+            return names
+
+    def reload(self, table):
+        """Recarga la tabla si no se cargó en los últimos reload_seconds; devuelve si la recargó"""
+        with self._lock:
+            if time.monotonic() - self._loaded_at.get(table, float("-inf")) < self.reload_seconds:
+                return False
+            # Se conservan los ids añadidos en este proceso (pueden no ser aún visibles en BigQuery)
+            names = self._load(table, self._names.get(table, {}))
+        print(f"Caché de {table} recargada ({len(names)} ids)")
+        return True
+
+    def _load(self, table, current):
+        # Con el lock tomado; si falla no se guarda nada y se reintenta en el siguiente uso
+        try:
+            loaded = self.loader(table)
+        except Exception as e:
+            raise DimensionUnavailable(f"No se pudo cargar {table} desde BigQuery: {e}") from e
+        names = {**current, **loaded}
+        self._names[table] = names
+        self._loaded_at[table] = time.monotonic()
+        return names
+
+    def add(self, table, rows):
+        # Copia y reemplazo: los lectores nunca ven el diccionario a medio actualizar. Se hace con
+        # el lock tomado para que dos add concurrentes no partan de la misma copia y se pierdan ids
+        with self._lock:
+            names = self._names.get(table)
+            if names is None:
+                names = self._load(table, {})
+            names = dict(names)
+            names.update({row["id"]: row["name"] for row in rows})
+            self._names[table] = names
+
+    def invalidate(self, table):
+        """Descarta la tabla (p. ej. tras un restore); se recarga en el siguiente uso"""
+        with self._lock:
+            self._names.pop(table, None)
+
+    def reference_error(self, table, row):
+        """Error de la primera clave foránea inexistente de una fila (None si todas existen)"""
+        for column, dimension in FOREIGN_KEYS.get(table, {}).items():
+            if row[column] not in self.names(dimension) and (
+                not self.reload(dimension) or row[column] not in self.names(dimension)
+            ):
+                return f"{column} {row[column]} no existe en {dimension}"
+        return None
+
+    def reference_errors(self, table, df):
+        """Versión vectorizada de reference_error para un DataFrame"""
+        errors = pd.Series(None, index=df.index, dtype=object)
+        for column, dimension in FOREIGN_KEYS.get(table, {}).items():
+            missing = ~df[column].isin(list(self.names(dimension))) & errors.isna()
+            if missing.any() and self.reload(dimension):
+                missing = ~df[column].isin(list(self.names(dimension))) & errors.isna()
+            errors[missing] = [f"{column} {value} no existe en {dimension}" for value in df.loc[missing, column]]
+        return errors
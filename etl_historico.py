@@ -1,26 +1,63 @@
+import numpy as np
 import pandas as pd
-from bq_client import BigQueryClient
-from validation import validate_departments, validate_jobs, validate_hired_employees
+from bq_client import BigQueryClient, LazyBigQueryClient, PRIMARY_KEYS
+from checkpoints import CheckpointStore, CsvCheckpoint
+from csv_reader import prefetch, read_csv_batches
+from dimensions import DIMENSION_TABLES, FOREIGN_KEYS, DimensionCache
+from pk_index import PrimaryKeyIndexes
+from validation import validate_departments_df, validate_jobs_df, validate_hired_employees_df
 import os
+import argparse
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # Configuración
 PROJECT_ID = "migracionpoc"
 DATASET = "migration_poc"
 CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
+# Filas por chunk del lector pandas
 CHUNK_SIZE = 1000
 
+# Lector de CSV: arrow (una pasada, chunks según ETL_READ_MEMORY_MB) o pandas (chunks de CHUNK_SIZE)
+CSV_READER = os.getenv("ETL_CSV_READER", "arrow")
+READ_MEMORY_MB = int(os.getenv("ETL_READ_MEMORY_MB", "256"))
+
 # Flag para ejecutar en modo seguro (no inserta en BD)
 DRY_RUN = os.getenv("DRY_RUN", "false").lower() == "true"
 
+# Modo bulk: ficheros Parquet locales + load jobs en lugar de streaming inserts
+BULK_DIR = os.getenv("ETL_BULK_DIR", "/tmp/etl_bulk")
+BULK_MAX_ROWS_PER_FILE = int(os.getenv("ETL_BULK_MAX_ROWS_PER_FILE", "5000000"))
+# Opcional (gs://bucket/ruta): los Parquet se suben a GCS y se cargan en un solo load job;
+# sin él se cargan en una tabla de staging que se copia a la final
+BULK_GCS_PREFIX = os.getenv("ETL_BULK_GCS_PREFIX")
+
+# Checkpoints: progreso por CSV para reanudar tras un fallo (cada N chunks confirmados)
+STATE_FILE = os.getenv("ETL_STATE_FILE", "/app/state/etl_state.json")
+CHECKPOINT_EVERY = int(os.getenv("ETL_CHECKPOINT_EVERY", "20"))
+
 TABLE_SCHEMAS = {
     "departments": ["id", "name"],
     "jobs": ["id", "name"],
     "hired_employees": ["id", "name", "datetime", "department_id", "job_id"]
 }
 
-# Inicializar cliente
-bq = BigQueryClient(PROJECT_ID, DATASET, credentials_path=CREDENTIALS_PATH)
+# Inicializar cliente (en el primer uso: importar el módulo no abre conexiones)
+bq = LazyBigQueryClient(lambda: BigQueryClient(PROJECT_ID, DATASET, credentials_path=CREDENTIALS_PATH))
+
+# Índice local de claves primarias: los duplicados van a la DLQ sin llegar a BigQuery
+pk_indexes = PrimaryKeyIndexes(
+    lambda table: bq.primary_keys(table), bloom=os.getenv("PK_INDEX_BLOOM", "true").lower() == "true"
+)
+
+# Caché de dimensiones para validar claves foráneas (en DRY_RUN parte vacía y se llena con los CSV)
+dimensions = DimensionCache(lambda table: {} if DRY_RUN else bq.dimension_names(table))
 
 # Mapear CSV a tabla y función de validación
 DATA_DIR = "/app/data"
@@ -28,26 +65,29 @@ DATA_DIR = "/app/data"
 tables_config = {
     "departments": {
         "csv": os.path.join(DATA_DIR, "departments.csv"),
-        "validator": validate_departments
+        "validator": validate_departments_df
     },
     "jobs": {
         "csv": os.path.join(DATA_DIR, "jobs.csv"),
-        "validator": validate_jobs
+        "validator": validate_jobs_df
     },
     "hired_employees": {
         "csv": os.path.join(DATA_DIR, "hired_employees.csv"),
-        "validator": validate_hired_employees
+        "validator": validate_hired_employees_df
     }
 }
 
-def read_csv_with_schema(csv_path, table_name, chunksize):
+def read_csv_with_schema(csv_path, table_name, chunksize, skip_rows=0):
     expected_cols = TABLE_SCHEMAS[table_name]
 
     # Intentar leer con header
     try:
         test_df = pd.read_csv(csv_path, nrows=5, dtype=str)
         if set(expected_cols).issubset(test_df.columns):
-            return pd.read_csv(csv_path, chunksize=chunksize, dtype=str)
+            return pd.read_csv(
+                csv_path, chunksize=chunksize, dtype=str,
+                skiprows=range(1, skip_rows + 1) if skip_rows else None
+            )
     except Exception:
         pass
 
@@ -57,34 +97,408 @@ def read_csv_with_schema(csv_path, table_name, chunksize):
         chunksize=chunksize,
         header=None,
         names=expected_cols,
-        dtype=str
+        dtype=str,
+        skiprows=skip_rows
+    )
+
+
+def read_csv_chunks(csv_path, table_name, skip_rows=0, in_flight=1):
+    """Chunks de strings del CSV con el lector configurado; in_flight: chunks que el llamador retiene a la vez"""
+    if CSV_READER == "pandas":
+        return read_csv_with_schema(csv_path, table_name, CHUNK_SIZE, skip_rows)
+    # Se lee un chunk por adelantado en otro hilo: cuenta también para el presupuesto de memoria
+    chunks = read_csv_batches(
+        csv_path, TABLE_SCHEMAS[table_name], READ_MEMORY_MB * 1024 * 1024, in_flight + 1, skip_rows,
+        on_invalid_row=lambda record, error: send_invalid_row(table_name, record, error),
     )
+    return prefetch(chunks)
+
+
+def new_stats():
+    return {"rows": 0, "rejected": 0, "inserted": 0, "insert_errors": 0, "already_loaded": 0}
+
+
+def add_stats(stats, other):
+    for key, value in other.items():
+        stats[key] = stats.get(key, 0) + value
+
+
+def split_orphans(table_name, valid_df):
+    """Separa las filas con claves foráneas que no existen en la caché de dimensiones"""
+    if table_name not in FOREIGN_KEYS or valid_df.empty:
+        return valid_df, valid_df.iloc[0:0]
+    errors = dimensions.reference_errors(table_name, valid_df)
+    orphans = errors.notna()
+    orphans_df = valid_df[orphans].copy()
+    orphans_df["error"] = errors[orphans]
+    return valid_df[~orphans], orphans_df
+
+
+def check_references(table_name, valid_df, resumed=False):
+    """Claves foráneas y duplicados; devuelve (válidas, rechazadas con su error, ya cargadas)"""
+    valid_df, orphans_df = split_orphans(table_name, valid_df)
+    valid_df, duplicates_df, already_loaded = split_duplicates(table_name, valid_df, resumed)
+    return valid_df, pd.concat([orphans_df, duplicates_df]), already_loaded
+
+
+def split_duplicates(table_name, valid_df, resumed=False):
+    """Separa las filas cuya clave primaria ya existe (o se repite en el chunk), con su error.
+    Al reanudar, las que ya estaban en BigQuery al arrancar se dan por cargadas (las confirmó la
+    ejecución interrumpida después de su último checkpoint): se omiten y solo se cuentan"""
+    if DRY_RUN or table_name not in PRIMARY_KEYS or valid_df.empty:
+        return valid_df, valid_df.iloc[0:0], 0
+    key = PRIMARY_KEYS[table_name]
+    keys = valid_df[key].to_numpy()
+    duplicated = pk_indexes.claim(table_name, keys)
+    already_loaded = np.zeros(len(keys), dtype=bool)
+    if resumed:
+        already_loaded = duplicated & pk_indexes.loaded(table_name, keys)
+    duplicates_df = valid_df[duplicated & ~already_loaded].copy()
+    duplicates_df["error"] = [f"{key} duplicado: {value} ya existe en {table_name}" for value in duplicates_df[key]]
+    return valid_df[~duplicated], duplicates_df, int(already_loaded.sum())
+
+
+def send_rejected(table_name, rejected_df):
+    for row_dict in rejected_df.to_dict("records"):
+        error = row_dict.pop("error")
+        send_invalid_row(table_name, row_dict, error)
+
+
+def send_invalid_row(table_name, row_dict, error):
+    # También la usa el lector arrow para las filas que no se pudieron parsear
+    if DRY_RUN:
+        print(f"[DRY RUN] DLQ {table_name}: {row_dict} → {error}")
+    else:
+        bq.insert_dlq(table_name, row_dict, error)
+
+
+class ParquetSink:
+    """Acumula chunks validados en ficheros Parquet locales para cargarlos de una vez al terminar"""
+
+    def __init__(self, table_name, out_dir=BULK_DIR, max_rows_per_file=BULK_MAX_ROWS_PER_FILE, dry_run=DRY_RUN):
+        self.table_name = table_name
+        self.max_rows_per_file = max_rows_per_file
+        self.dry_run = dry_run
+        self.paths = []
+        self.rows = 0
+        # Claves reservadas en el índice de duplicados: se liberan si el load job falla
+        self.key_column = PRIMARY_KEYS.get(table_name)
+        self._keys = []
+        self._writer = None
+        self._schema = None
+        self._rows_in_file = 0
+        self._lock = threading.Lock()
+        # Directorio propio de cada ejecución: ejecuciones simultáneas o sucesivas no se pisan
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = tempfile.mkdtemp(prefix=f"{table_name}_", dir=out_dir)
+
+    def _to_arrow(self, df):
+        df = df.reset_index(drop=True)
+        if "hired_timestamp" in df:
+            # BigQuery no convierte STRING a TIMESTAMP al cargar Parquet
+            df["hired_timestamp"] = pd.to_datetime(df["hired_timestamp"], utc=True, format="ISO8601")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._schema is None:
+            self._schema = table.schema
+        return table.cast(self._schema)
+
+    def write(self, df):
+        if self.dry_run:
+            # En DRY_RUN solo se cuentan las filas, sin escribir ficheros
+            with self._lock:
+                self.rows += len(df)
+            return len(df)
+        with self._lock:
+            self.rows += len(df)
+            if self.key_column is not None:
+                self._keys.append(df[self.key_column].to_numpy())
+            table = self._to_arrow(df)
+            if self._writer is None or self._rows_in_file >= self.max_rows_per_file:
+                self._roll()
+            self._writer.write_table(table)
+            self._rows_in_file += len(table)
+        return len(table)
+
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+        path = os.path.join(self.out_dir, f"{self.table_name}_{len(self.paths):04d}.parquet")
+        self._writer = pq.ParquetWriter(path, self._schema, coerce_timestamps="us")
+        self.paths.append(path)
+        self._rows_in_file = 0
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        return self.paths
+
+    def keys(self):
+        with self._lock:
+            return [key for chunk in self._keys for key in chunk.tolist()]
+
+    def cleanup(self):
+        shutil.rmtree(self.out_dir, ignore_errors=True)
 
 
-def process_csv(table_name, csv_path, validator):
+def commit_bulk(table_name, sink):
+    # Todos los Parquet en un solo commit (WRITE_APPEND): si algo falla la tabla no cambia
+    # y los ficheros se conservan en sink.out_dir
+    paths = sink.close()
+    if DRY_RUN or sink.dry_run:
+        print(f"[DRY RUN] Cargaría {sink.rows} filas en {table_name}")
+        sink.cleanup()
+        return
+    if paths:
+        try:
+            bq.load_files_atomically(table_name, paths, write_disposition="WRITE_APPEND", gcs_prefix=BULK_GCS_PREFIX)
+        except Exception:
+            # Nada llegó a la tabla: se liberan las claves para que un reintento no las vea como duplicadas
+            if sink.key_column is not None:
+                pk_indexes.release(table_name, sink.keys())
+            raise
+    sink.cleanup()
+    # Tras una carga masiva, el resumen se reconstruye en lugar de actualizarse por deltas
+    if table_name == "hired_employees" and paths:
+        bq.rebuild_hiring_summary()
+
+
+def send_valid(table_name, valid_df, sink=None):
+    # Devuelve el número de filas insertadas (o escritas en Parquet en modo bulk)
+    if sink is not None:
+        written = sink.write(valid_df)
+        if table_name in DIMENSION_TABLES:
+            dimensions.add(table_name, valid_df.to_dict("records"))
+        return written
+    valid_rows = valid_df.to_dict("records")
+    if DRY_RUN:
+        print(f"[DRY RUN] Insertaría {len(valid_rows)} filas en {table_name}")
+        if table_name in DIMENSION_TABLES:
+            dimensions.add(table_name, valid_rows)
+        return len(valid_rows)
+    # El cliente parte las filas en lotes dentro de los límites de streaming y manda las que fallan a la DLQ
+    inserted, failed = bq.insert_rows_with_failures(table_name, valid_rows)
+    if failed:
+        if table_name in PRIMARY_KEYS:
+            # Se liberan las claves de las filas que fallaron para que un reintento no las vea como duplicadas
+            pk_indexes.release(table_name, valid_df[PRIMARY_KEYS[table_name]].to_numpy()[failed])
+        failed_set = set(failed)
+        valid_rows = [row for i, row in enumerate(valid_rows) if i not in failed_set]
+    if valid_rows and table_name in DIMENSION_TABLES:
+        dimensions.add(table_name, valid_rows)
+    if valid_rows and table_name == "hired_employees":
+        bq.update_hiring_summary(valid_rows)
+    return inserted
+
+
+def resume_from(csv_path, checkpoint, stats):
+    # Devuelve las filas de datos a saltar (None si el CSV ya se completó) y
+    # parte de las estadísticas guardadas en el checkpoint
+    if checkpoint is None:
+        return 0
+    add_stats(stats, checkpoint.stats)
+    if checkpoint.done:
+        print(f"{csv_path} ya procesado según el checkpoint: se omite")
+        return None
+    if checkpoint.start_row:
+        print(f"Reanudando {csv_path} desde la fila {checkpoint.start_row}")
+    return checkpoint.start_row
+
+
+def finish_csv(table_name, sink, checkpoint, resumed=False):
+    if sink is not None:
+        commit_bulk(table_name, sink)
+    # Enviar lo que quede pendiente en el buffer de la DLQ
+    if not DRY_RUN:
+        bq.flush_dlq()
+        # Al reanudar se reenvían chunks cuyos deltas pudieron llegar antes del fallo y la
+        # deduplicación por insertId de BigQuery dura solo unos minutos: se reconstruye el resumen
+        if resumed and sink is None and table_name == "hired_employees":
+            bq.rebuild_hiring_summary()
+    if checkpoint is not None:
+        checkpoint.finish()
+
+
+def process_csv(table_name, csv_path, validator, sink=None, checkpoint=None):
     print(f"Procesando {csv_path} → {table_name}")
+    stats = new_stats()
+    start_row = resume_from(csv_path, checkpoint, stats)
+    if start_row is None:
+        return stats
+
+    for index, chunk in enumerate(read_csv_chunks(csv_path, table_name, start_row)):
+        # Validación vectorizada de todo el chunk
+        valid_df, rejected_df = validator(chunk)
+        valid_df, conflicts_df, already_loaded = check_references(table_name, valid_df, resumed=start_row > 0)
+        chunk_stats = new_stats()
+        chunk_stats["rows"] = len(chunk)
+        chunk_stats["rejected"] = len(rejected_df) + len(conflicts_df)
+        chunk_stats["already_loaded"] = already_loaded
+        send_rejected(table_name, rejected_df)
+        send_rejected(table_name, conflicts_df)
+
+        if not valid_df.empty:
+            inserted = send_valid(table_name, valid_df, sink)
+            chunk_stats["inserted"] = inserted
+            chunk_stats["insert_errors"] = len(valid_df) - inserted
+        add_stats(stats, chunk_stats)
+        # En modo bulk los chunks solo quedan confirmados tras el load job final
+        if checkpoint is not None and sink is None:
+            checkpoint.chunk_done(index, chunk_stats)
+
+    finish_csv(table_name, sink, checkpoint, resumed=start_row > 0)
+    return stats
+
+
+# ------------------
+# Modo paralelo: validación en procesos, inserts en hilos
+# ------------------
+def process_csv_parallel(table_name, csv_path, validator, cpu_pool, io_pool, max_pending, sink=None,
+                         checkpoint=None):
+    """Procesa un CSV solapando validación (cpu_pool) e inserts (io_pool)"""
+    # Como mucho `max_pending` chunks en validación y otros tantos en insert:
+    # si se llena alguna de las colas, la lectura del CSV espera (backpressure)
+    print(f"Procesando en paralelo {csv_path} → {table_name}")
+    stats = new_stats()
+    start_row = resume_from(csv_path, checkpoint, stats)
+    if start_row is None:
+        return stats
+    lock = threading.Lock()
+    insert_slots = threading.BoundedSemaphore(max_pending)
+    validating = deque()
+    inserting = []
+
+    def chunk_done(index, chunk_stats):
+        with lock:
+            add_stats(stats, chunk_stats)
+        if checkpoint is not None and sink is None:
+            checkpoint.chunk_done(index, chunk_stats)
+
+    def insert_chunk(index, valid_df, chunk_stats):
+        try:
+            inserted = send_valid(table_name, valid_df, sink)
+            chunk_stats["inserted"] = inserted
+            chunk_stats["insert_errors"] = len(valid_df) - inserted
+            chunk_done(index, chunk_stats)
+        finally:
+            insert_slots.release()
+
+    def drain_one():
+        index, rows, future = validating.popleft()
+        valid_df, rejected_df = future.result()
+        valid_df, conflicts_df, already_loaded = check_references(table_name, valid_df, resumed=start_row > 0)
+        chunk_stats = new_stats()
+        chunk_stats["rows"] = rows
+        chunk_stats["rejected"] = len(rejected_df) + len(conflicts_df)
+        chunk_stats["already_loaded"] = already_loaded
+        send_rejected(table_name, rejected_df)
+        send_rejected(table_name, conflicts_df)
+        if valid_df.empty:
+            chunk_done(index, chunk_stats)
+        else:
+            insert_slots.acquire()
+            inserting.append(io_pool.submit(insert_chunk, index, valid_df, chunk_stats))
 
-    for chunk in read_csv_with_schema(csv_path, table_name, CHUNK_SIZE):
-        valid_rows = []
-        for _, row in chunk.iterrows():
-            row_dict = row.to_dict()
-            validated, error = validator(row_dict)
-            if error:
-                if DRY_RUN:
-                    print(f"[DRY RUN] DLQ {table_name}: {row_dict} → {error}")
-                else:
-                    bq.insert_dlq(table_name, row_dict, error)
-            else:
-                valid_rows.append(validated)
-
-        if valid_rows:
-            if DRY_RUN:
-                print(f"[DRY RUN] Insertaría {len(valid_rows)} filas en {table_name}")
-            else:
-                bq.insert_rows(table_name, valid_rows)
+    # En memoria a la vez: hasta max_pending chunks en validación, otros tantos en insert y el que se lee
+    in_flight = 2 * max_pending + 1
+    for index, chunk in enumerate(read_csv_chunks(csv_path, table_name, start_row, in_flight)):
+        validating.append((index, len(chunk), cpu_pool.submit(validator, chunk)))
+        if len(validating) >= max_pending:
+            drain_one()
+
+    while validating:
+        drain_one()
+    for future in inserting:
+        future.result()
+
+    finish_csv(table_name, sink, checkpoint, resumed=start_row > 0)
+    return stats
+
+
+def make_sink(table_name, mode):
+    return ParquetSink(table_name) if mode == "bulk" else None
+
+
+def make_checkpoint(store, csv_path):
+    # Sin checkpoints en DRY_RUN; al guardar se vacía la DLQ para no perder rechazos
+    if store is None or DRY_RUN:
+        return None
+    return CsvCheckpoint(store, csv_path, every=CHECKPOINT_EVERY, on_save=lambda: bq.flush_dlq())
+
+
+def run_parallel(workers, mode="stream", store=None):
+    # Las tablas de cada fase se cargan a la vez y comparten los pools de validación e insert;
+    # las dimensiones van primero para poder validar las claves foráneas de hired_employees
+    max_pending = workers * 2
+    phases = [
+        [table for table in tables_config if table in DIMENSION_TABLES],
+        [table for table in tables_config if table not in DIMENSION_TABLES],
+    ]
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=workers) as io_pool, \
+            ThreadPoolExecutor(max_workers=len(tables_config)) as table_pool:
+        for phase in phases:
+            futures = {
+                table: table_pool.submit(
+                    process_csv_parallel, table, tables_config[table]["csv"], tables_config[table]["validator"],
+                    cpu_pool, io_pool, max_pending, make_sink(table, mode),
+                    make_checkpoint(store, tables_config[table]["csv"])
+                )
+                for table in phase
+            }
+            results.update({table: future.result() for table, future in futures.items()})
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Carga histórica de CSV a BigQuery")
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("ETL_WORKERS", "1")),
+        help="Número de workers; con más de 1 se usa el modo paralelo"
+    )
+    parser.add_argument(
+        "--mode", choices=["stream", "bulk"], default=os.getenv("ETL_MODE", "stream"),
+        help="stream: streaming inserts; bulk: ficheros Parquet + load jobs"
+    )
+    parser.add_argument(
+        "--state-file", default=STATE_FILE,
+        help="Fichero de checkpoints para reanudar la carga tras un fallo"
+    )
+    parser.add_argument(
+        "--reset", action="store_true",
+        help="Ignora los checkpoints y procesa todos los CSV desde el inicio"
+    )
+    parser.add_argument(
+        "--migrate", action="store_true",
+        help="Migra al layout particionado las tablas existentes que aún no lo tengan "
+             "(sin la API ni otras cargas escribiendo en ellas)"
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    print(f"Iniciando ETL (DRY_RUN={DRY_RUN})")
-    for table, cfg in tables_config.items():
-        process_csv(table, cfg["csv"], cfg["validator"])
+    args = parse_args()
+    print(f"Iniciando ETL (DRY_RUN={DRY_RUN}, workers={args.workers}, mode={args.mode})")
+    if not DRY_RUN:
+        # Crea las tablas que falten ya particionadas/agrupadas; las existentes solo se
+        # migran con --migrate (la migración reescribe la tabla)
+        print(f"Esquema: {bq.ensure_schema(migrate=args.migrate)}")
+        # Índices de duplicados calientes antes de leer ningún CSV (falla aquí si BigQuery no responde)
+        pk_indexes.warm(table for table in tables_config if table in PRIMARY_KEYS)
+    store = CheckpointStore(args.state_file)
+    if args.reset:
+        store.reset()
+    if args.workers > 1:
+        results = run_parallel(args.workers, args.mode, store)
+    else:
+        results = {
+            table: process_csv(
+                table, cfg["csv"], cfg["validator"], make_sink(table, args.mode),
+                make_checkpoint(store, cfg["csv"])
+            )
+            for table, cfg in tables_config.items()
+        }
+    for table, stats in results.items():
+        print(f"{table}: {stats}")
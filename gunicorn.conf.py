@@ -0,0 +1,49 @@
+# Configuración de gunicorn para servir la API en producción:
+#   gunicorn -c gunicorn.conf.py api:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Un worker con muchos hilos: las llamadas a BigQuery liberan el GIL, así que los
+# requests se atienden en paralelo y la caché de analytics y la cola de /ingest/async
+# son las mismas para todos. Con API_WORKERS > 1 cada worker tiene su propia caché
+# y su propia cola (el estado de /ingest/async solo lo conoce el worker que lo recibió).
+workers = int(os.getenv("API_WORKERS", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("API_THREADS", "32"))
+
+timeout = int(os.getenv("API_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Métricas de varios workers: el directorio debe empezar vacío en cada arranque
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def post_worker_init(worker):
+    # Cada worker calienta sus índices de claves antes de atender requests
+    import api
+    api.warm_indexes()
+
+
+def worker_exit(server, worker):
+    # Al parar (SIGTERM, reinicio) se inserta lo que quede en la cola de /ingest/async
+    import api
+    api.drain_ingest_queue()
+
+
+def child_exit(server, worker):
+    # Los ficheros de métricas de un worker que termina dejan de contar como activos
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
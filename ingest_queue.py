@@ -0,0 +1,176 @@
+import queue
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class IngestQueueClosed(RuntimeError):
+    """La cola se está vaciando para parar el proceso y no acepta más ingestas"""
+
+
+class IngestPaused(RuntimeError):
+    """Las ingestas están pausadas (p. ej. durante una migración de esquema)"""
+
+
+class IngestGate:
+    """Cuenta las ingestas en curso y permite pausarlas esperando a que terminen"""
+
+    def __init__(self):
+        self._active = 0
+        self._paused = None
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def enter(self):
+        with self._cond:
+            if self._paused:
+                raise IngestPaused(f"Ingestas pausadas: {self._paused}")
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def paused(self, reason, timeout=30.0):
+        """Rechaza ingestas nuevas y espera a las que están en curso; lanza TimeoutError si no terminan"""
+        with self._cond:
+            if self._paused:
+                raise IngestPaused(f"Ingestas ya pausadas: {self._paused}")
+            self._paused = reason
+            if not self._cond.wait_for(lambda: self._active == 0, timeout=timeout):
+                self._paused = None
+                raise TimeoutError(f"{self._active} ingestas siguen en curso tras {timeout} s")
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._paused = None
+
+
+class IngestQueue:
+    """Cola de ingesta asíncrona: un hilo en segundo plano agrupa los registros
+    encolados por tabla y los inserta en lotes grandes"""
+
+    def __init__(self, insert, max_batch_rows=5000, max_wait_seconds=1.0, max_statuses=10000):
+        # insert(table, rows) -> (filas insertadas, índices de las filas que fallaron)
+        self.insert = insert
+        self.max_batch_rows = max_batch_rows
+        self.max_wait_seconds = max_wait_seconds
+        self.max_statuses = max_statuses
+        self._queue = queue.Queue()
+        self._statuses = OrderedDict()
+        self._lock = threading.Lock()
+        # Ingestas encoladas sin insertar todavía (para esperar a que se vacíe al parar)
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._worker = None
+
+    def submit(self, table, rows, errors):
+        """Encola filas ya validadas; `errors` son los rechazos ya enviados a la DLQ"""
+        ingest_id = uuid.uuid4().hex
+        with self._lock:
+            if self._closed:
+                raise IngestQueueClosed("La cola de ingesta se está cerrando")
+            self._statuses[ingest_id] = {
+                "id": ingest_id,
+                "table": table,
+                "status": "queued" if rows else "done",
+                "accepted": len(rows),
+                "inserted": 0,
+                "errors": errors,
+            }
+            while len(self._statuses) > self.max_statuses:
+                self._statuses.popitem(last=False)
+            if rows:
+                self._pending += 1
+            self._ensure_worker()
+        if rows:
+            self._queue.put((ingest_id, table, rows))
+        return ingest_id
+
+    def drain(self, timeout=25.0):
+        """Deja de aceptar ingestas y espera a que se inserte lo encolado (al parar el proceso).
+        Devuelve cuántas ingestas quedaron sin insertar"""
+        with self._lock:
+            self._closed = True
+            if self._pending:
+                self._ensure_worker()
+            self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+            if self._pending:
+                print(f"⚠️ {self._pending} ingestas asíncronas sin insertar al parar")
+            return self._pending
+
+    def wait_idle(self, timeout=25.0):
+        """Espera a que se inserte lo encolado sin cerrar la cola; devuelve si quedó vacía"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def status(self, ingest_id):
+        with self._lock:
+            status = self._statuses.get(ingest_id)
+            return dict(status) if status else None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            rows = len(batch[0][2])
+            deadline = time.monotonic() + self.max_wait_seconds
+            # Agrupar lo que llegue hasta llenar el lote o agotar la espera
+            while rows < self.max_batch_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item[2])
+            self._flush(batch)
+
+    def _flush(self, batch):
+        by_table = {}
+        for ingest_id, table, rows in batch:
+            by_table.setdefault(table, []).append((ingest_id, rows))
+
+        for table, items in by_table.items():
+            all_rows = [row for _, rows in items for row in rows]
+            try:
+                _, failed = self.insert(table, all_rows)
+                failed, error = sorted(failed), None
+            except Exception as e:
+                failed, error = [], str(e)
+            with self._lock:
+                start = 0
+                for ingest_id, rows in items:
+                    # Las filas que fallaron se reparten entre las ingestas según su tramo del lote
+                    end = start + len(rows)
+                    dlq = [i - start for i in failed[bisect_left(failed, start):bisect_left(failed, end)]]
+                    start = end
+                    status = self._statuses.get(ingest_id)
+                    if status is None:
+                        continue
+                    inserted = 0 if error else len(rows) - len(dlq)
+                    status["status"] = "done" if inserted else "failed"
+                    status["inserted"] = inserted
+                    if dlq:
+                        # Posiciones (desde 0) dentro de las filas aceptadas que acabaron en la DLQ
+                        status["dlq"] = dlq
+                    if error:
+                        status["insert_error"] = error
+                    elif not inserted:
+                        status["insert_error"] = "BigQuery rechazó todas las filas (enviadas a la DLQ)"
+                self._pending -= len(items)
+                self._idle.notify_all()
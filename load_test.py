@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Prueba de carga de la API: mide throughput y latencia de /analytics/* e /ingest
+# con distintos niveles de concurrencia. Ejecutar contra un dataset de pruebas:
+# el escenario de ingesta inserta registros reales.
+#
+#   python load_test.py --url http://localhost:5000 --concurrency 1 4 16 32
+
+SCENARIOS = ["hired_by_quarter", "departments_above_average", "ingest"]
+
+
+def make_request(session, url, scenario, years):
+    if scenario == "ingest":
+        base_id = random.randint(1_000_000, 9_000_000)
+        records = [{"id": base_id + i, "name": f"Load test {base_id + i}"} for i in range(10)]
+        return session.post(f"{url}/ingest", json={"table": "departments", "records": records}, timeout=60)
+    return session.get(f"{url}/analytics/{scenario}/{random.choice(years)}", timeout=60)
+
+
+def run_level(url, api_key, scenario, concurrency, duration, years):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        nonlocal errors
+        session = requests.Session()
+        session.headers["x-api-key"] = api_key
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = make_request(session, url, scenario, years).status_code < 500
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else None,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de migración")
+    parser.add_argument("--url", default=os.getenv("API_URL", "http://localhost:5000"))
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", ""))
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 32])
+    parser.add_argument("--duration", type=float, default=10.0, help="Segundos por nivel de concurrencia")
+    parser.add_argument("--years", nargs="+", type=int, default=list(range(2015, 2025)))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"{'escenario':<28}{'conc':>6}{'req':>8}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            r = run_level(args.url, args.api_key, scenario, concurrency, args.duration, args.years)
+            p50 = f"{r['p50_ms']:.1f}" if r["p50_ms"] is not None else "-"
+            p95 = f"{r['p95_ms']:.1f}" if r["p95_ms"] is not None else "-"
+            print(f"{scenario:<28}{concurrency:>6}{r['requests']:>8}{r['errors']:>6}{r['rps']:>10.1f}{p50:>10}{p95:>10}")
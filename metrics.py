@@ -0,0 +1,69 @@
+import functools
+import time
+
+from prometheus_client import Counter, Histogram
+
+# ------------------
+# Métricas en formato Prometheus (expuestas en /metrics por la API). Este módulo no
+# depende de Flask: lo importan también el cliente de BigQuery y el ETL.
+# Con varios procesos (gunicorn con API_WORKERS > 1) hay que definir
+# PROMETHEUS_MULTIPROC_DIR antes de importarlo
+# ------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram(
+    "api_request_duration_seconds", "Latencia de los requests por endpoint",
+    ["endpoint", "method"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    "api_requests_total", "Requests atendidos por endpoint y código de estado",
+    ["endpoint", "method", "status"],
+)
+BQ_CALL_LATENCY = Histogram(
+    "bq_call_duration_seconds", "Latencia de los métodos de BigQueryClient",
+    ["method"], buckets=LATENCY_BUCKETS,
+)
+BQ_CALL_ERRORS = Counter(
+    "bq_call_errors_total", "Excepciones en métodos de BigQueryClient", ["method"],
+)
+ROWS_INSERTED = Counter("bq_rows_inserted_total", "Filas insertadas por tabla", ["table"])
+INSERT_ERRORS = Counter("bq_insert_errors_total", "Filas con error al insertar por tabla", ["table"])
+INSERT_RETRIES = Counter("bq_insert_retries_total", "Filas reenviadas tras un error de streaming insert", ["table"])
+DLQ_ROWS = Counter("dlq_rows_total", "Registros enviados a la DLQ por tabla de origen", ["table"])
+BYTES_EXPORTED = Counter("bq_bytes_exported_total", "Bytes escritos en backups locales", ["table"])
+BYTES_RESTORED = Counter("bq_bytes_restored_total", "Bytes cargados en restores", ["table"])
+
+QUERY_BYTES_PROCESSED = Histogram(
+    "bq_query_bytes_processed", "Bytes procesados por consulta",
+    ["query"], buckets=tuple(10 ** exp for exp in range(3, 14)),
+)
+QUERY_SLOT_MS = Counter("bq_query_slot_milliseconds_total", "Slot-milisegundos consumidos", ["query"])
+QUERIES = Counter("bq_queries_total", "Consultas ejecutadas", ["query", "cache_hit"])
+QUERIES_OVER_BUDGET = Counter(
+    "bq_queries_over_budget_total", "Consultas que superan el presupuesto de bytes", ["query"],
+)
+
+def instrument_methods(cls):
+    """Mide latencia y errores de cada método público de la clase"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or not callable(attr):
+            continue
+        setattr(cls, name, _timed(name, attr))
+    return cls
+
+
+def _timed(name, func):
+    latency = BQ_CALL_LATENCY.labels(name)
+    errors = BQ_CALL_ERRORS.labels(name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+    return wrapper
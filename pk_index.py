@@ -0,0 +1,222 @@
+import threading
+
+import numpy as np
+
+# Constantes del hash multiplicativo del filtro de Bloom (enteros de 64 bits)
+_HASH_A = np.uint64(0x9E3779B97F4A7C15)
+_HASH_B = np.uint64(0xC2B2AE3D27D4EB4F)
+
+
+class BloomFilter:
+    """Filtro de Bloom por bloques (numpy): los bits de cada clave caen en una misma palabra de 64 bits"""
+
+    def __init__(self, capacity, bits_per_key=10, hashes=7):
+        self.capacity = max(int(capacity), 1024)
+        self.hashes = hashes
+        # Número de palabras: potencia de dos para indexar con los bits altos del hash
+        bits = int(np.ceil(np.log2(self.capacity * bits_per_key / 64)))
+        self._shift = np.uint64(64 - bits)
+        self._words = np.zeros(2 ** bits, dtype=np.uint64)
+
+    def _locate(self, keys):
+        # Palabra con los bits altos de un hash; posiciones dentro de ella, de 6 en 6 bits del otro
+        keys = keys.astype(np.uint64)
+        index = (keys * _HASH_A) >> self._shift
+        h2 = keys * _HASH_B
+        mask = np.zeros(len(keys), dtype=np.uint64)
+        for i in range(self.hashes):
+            mask |= np.left_shift(np.uint64(1), (h2 >> np.uint64(6 * i)) & np.uint64(63))
+        return index, mask
+
+    def add(self, keys):
+        if not len(keys):
+            return
+        index, mask = self._locate(keys)
+        # Agrupa por palabra y combina las máscaras antes de escribir (índices repetidos)
+        order = np.argsort(index, kind="stable")
+        index, mask = index[order], mask[order]
+        starts = np.flatnonzero(np.concatenate(([True], index[1:] != index[:-1])))
+        self._words[index[starts]] |= np.bitwise_or.reduceat(mask, starts)
+
+    def might_contain(self, keys):
+        index, mask = self._locate(keys)
+        return (self._words[index] & mask) == mask
+
+
+def _as_int64(keys):
+    # Devuelve (claves int64, máscara de claves representables); las que no caben en
+    # INT64 no se indexan (BigQuery las rechazará al insertar)
+    try:
+        keys = np.asarray(keys, dtype=np.int64)
+        return keys, np.ones(len(keys), dtype=bool)
+    except OverflowError:
+        ok = np.array([-2**63 <= key < 2**63 for key in keys], dtype=bool)
+        return np.array([key if fits else 0 for key, fits in zip(keys, ok)], dtype=np.int64), ok
+
+
+def _sorted_unique(keys):
+    # Equivalente a np.unique para int64, pero con un sort y una comparación (más rápido)
+    keys = np.sort(keys)
+    if len(keys) > 1:
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    return keys
+
+
+class PrimaryKeyIndex:
+    """Claves primarias enteras de una tabla: array ordenado + delta en memoria"""
+
+    def __init__(self, bloom=True, merge_every=250_000):
+        self.bloom = bloom
+        self.merge_every = merge_every
+        self._keys = np.empty(0, dtype=np.int64)
+        # Claves que había en BigQuery al calentar el índice (comparten el array hasta el primer merge)
+        self._loaded = self._keys
+        self._delta = set()
+        self._bloom = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys) + len(self._delta)
+
+    def replace(self, keys):
+        """Sustituye el contenido del índice (p. ej. al calentarlo desde BigQuery)"""
+        keys = _sorted_unique(np.asarray(keys, dtype=np.int64))
+        with self._lock:
+            self._keys = keys
+            self._loaded = keys
+            self._delta = set()
+            self._rebuild_bloom()
+
+    def claim(self, keys):
+        """Reserva las claves nuevas y devuelve la máscara de duplicadas (ya indexadas o repetidas en el lote)"""
+        keys, ok = _as_int64(keys)
+        with self._lock:
+            duplicated = np.zeros(len(keys), dtype=bool)
+            duplicated[ok] = self._contains(keys[ok])
+            # Dentro del propio lote solo cuenta la primera aparición de cada clave
+            _, first = np.unique(keys[ok], return_index=True)
+            repeated = np.ones(ok.sum(), dtype=bool)
+            repeated[first] = False
+            duplicated[ok] |= repeated
+            new_keys = keys[ok & ~duplicated]
+            self._delta.update(new_keys.tolist())
+            if self._bloom is not None:
+                self._bloom.add(new_keys)
+            if len(self._delta) >= self.merge_every:
+                self._merge()
+        return duplicated
+
+    def loaded(self, keys):
+        """Máscara de las claves que ya estaban en BigQuery al calentar el índice"""
+        keys, ok = _as_int64(keys)
+        with self._lock:
+            found = np.zeros(len(keys), dtype=bool)
+            if len(self._loaded):
+                pos = np.searchsorted(self._loaded, keys[ok])
+                pos[pos == len(self._loaded)] = 0
+                found[ok] = self._loaded[pos] == keys[ok]
+        return found
+
+    def release(self, keys):
+        """Libera claves reservadas cuyo insert falló, para que puedan reintentarse"""
+        keys, ok = _as_int64(keys)
+        with self._lock:
+            for key in keys[ok].tolist():
+                if key in self._delta:
+                    self._delta.discard(key)
+                else:
+                    pos = np.searchsorted(self._keys, key)
+                    if pos < len(self._keys) and self._keys[pos] == key:
+                        self._keys = np.delete(self._keys, pos)
+
+    def flush(self):
+        """Fusiona el delta con el array ordenado"""
+        with self._lock:
+            self._merge()
+
+    def _contains(self, keys):
+        found = np.zeros(len(keys), dtype=bool)
+        # El filtro de Bloom evita la búsqueda binaria para las claves seguro nuevas
+        candidates = self._bloom.might_contain(keys) if self._bloom is not None else np.ones(len(keys), dtype=bool)
+        candidate_keys = keys[candidates]
+        if len(self._keys):
+            pos = np.searchsorted(self._keys, candidate_keys)
+            pos[pos == len(self._keys)] = 0
+            hits = self._keys[pos] == candidate_keys
+        else:
+            hits = np.zeros(len(candidate_keys), dtype=bool)
+        if self._delta:
+            hits |= np.fromiter((key in self._delta for key in candidate_keys.tolist()), dtype=bool,
+                                count=len(candidate_keys))
+        found[candidates] = hits
+        return found
+
+    def _merge(self):
+        if self._delta:
+            # Las claves del delta nunca están en el array: basta con concatenar y ordenar
+            delta = np.fromiter(self._delta, dtype=np.int64, count=len(self._delta))
+            self._keys = np.sort(np.concatenate((self._keys, delta)), kind="stable")
+            self._delta = set()
+            if self._bloom is not None and len(self._keys) > self._bloom.capacity:
+                self._rebuild_bloom()
+
+    def _rebuild_bloom(self):
+        if not self.bloom:
+            return
+        # Capacidad con margen para no reconstruir a cada merge
+        self._bloom = BloomFilter(capacity=2 * len(self._keys))
+        self._bloom.add(self._keys)
+
+
+class PrimaryKeyIndexes:
+    """Índices por tabla; cada uno se calienta desde BigQuery al arrancar (warm) o la primera vez que se usa"""
+
+    def __init__(self, loader, bloom=True):
+        # loader(table) -> array con las claves primarias existentes en BigQuery
+        self.loader = loader
+        self.bloom = bloom
+        self._indexes = {}
+        self._warm_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, table):
+        with self._lock:
+            index = self._indexes.get(table)
+            if index is not None:
+                return index
+            warm_lock = self._warm_locks.setdefault(table, threading.Lock())
+        # El calentamiento de una tabla no bloquea los usos de las demás
+        with warm_lock:
+            with self._lock:
+                index = self._indexes.get(table)
+            if index is None:
+                index = PrimaryKeyIndex(bloom=self.bloom)
+                self._warm(table, index)
+                with self._lock:
+                    self._indexes[table] = index
+            return index
+
+    def warm(self, tables):
+        """Calienta por adelantado los índices de las tablas (al arrancar la API o el ETL)"""
+        for table in tables:
+            self.get(table)
+
+    def _warm(self, table, index):
+        # Si BigQuery falla el error se propaga y el índice no se guarda: un índice vacío
+        # dejaría pasar todos los duplicados; el siguiente uso vuelve a intentarlo
+        index.replace(self.loader(table))
+        print(f"Índice de claves de {table} cargado desde BigQuery ({len(index)} ids)")
+
+    def claim(self, table, keys):
+        return self.get(table).claim(keys)
+
+    def loaded(self, table, keys):
+        return self.get(table).loaded(keys)
+
+    def release(self, table, keys):
+        self.get(table).release(keys)
+
+    def invalidate(self, table):
+        """Descarta el índice (p. ej. tras un restore); se recalienta en el siguiente uso"""
+        with self._lock:
+            self._indexes.pop(table, None)
@@ -0,0 +1,52 @@
+import pyarrow as pa
+
+import api
+import benchmarks
+from bench_fake_bq import FakeBigQueryClient
+from ingest_queue import IngestQueue
+
+API_KEY = "test-key"
+
+
+def department():
+    return {"id": "1", "name": "Supply Chain"}
+
+
+def new_client():
+    # API contra el cliente falso, con índices, cachés y cola nuevos
+    fake = FakeBigQueryClient(call_latency=0)
+    fake.load_table("departments", pa.table({"id": pa.array([], pa.int64()), "name": pa.array([], pa.string())}))
+    benchmarks.bind_state(api, fake)
+    api.API_KEY = API_KEY
+    api.ingest_queue = IngestQueue(api.insert_validated, max_wait_seconds=0.01)
+    return fake, api.app.test_client()
+
+
+def post(client, path, table, records):
+    return client.post(path, json={"table": table, "records": records}, headers={"x-api-key": API_KEY})
+
+
+def run_async_closed_tests():
+    fake, client = new_client()
+    api.ingest_queue.drain(timeout=1)
+
+    # Cola cerrada (worker apagándose): 503 y las claves reservadas al validar se liberan
+    response = post(client, "/ingest/async", "departments", [department()])
+    assert response.status_code == 503, response.get_json()
+    assert not fake.rows("departments")
+
+    # El reintento no se rechaza como duplicado
+    response = post(client, "/ingest", "departments", [department()])
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json() == {"inserted": 1, "errors": []}
+    assert len(fake.rows("departments")) == 1
+
+    # Un segundo envío de la misma clave sí es duplicado
+    response = post(client, "/ingest", "departments", [department()])
+    assert response.status_code == 400
+    assert "duplicado" in response.get_json()["errors"][0]["error"]
+    print("async closed queue OK")
+
+
+if __name__ == "__main__":
+    run_async_closed_tests()
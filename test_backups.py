@@ -0,0 +1,80 @@
+import os
+import tempfile
+
+import pyarrow as pa
+
+from bench_fake_bq import FakeBigQueryClient, FakeRowIterator, InMemoryBigQuery
+from backups import backup_dataset, plan_shards, restore_dataset
+
+
+class StorageApiRowIterator(FakeRowIterator):
+    """Como la Storage Read API: con bqstorage_client se lee la tabla entera (sin start_index)"""
+
+    def __init__(self, table, full_table, page_size=10_000):
+        super().__init__(table, page_size)
+        self.full_table = full_table
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        if bqstorage_client is not None:
+            return FakeRowIterator(self.full_table, self.page_size).to_arrow_iterable()
+        return super().to_arrow_iterable()
+
+
+class StorageApiBigQuery(InMemoryBigQuery):
+    def list_rows(self, table, selected_fields=None, max_results=None, start_index=None, page_size=None,
+                  **kwargs):
+        rows = super().list_rows(table, selected_fields, max_results, start_index, page_size, **kwargs)
+        full_table = super().list_rows(table, selected_fields, page_size=page_size).table
+        return StorageApiRowIterator(rows.table, full_table, rows.page_size)
+
+
+class StorageApiFakeClient(FakeBigQueryClient):
+    def __init__(self):
+        super().__init__(call_latency=0)
+        self.client = StorageApiBigQuery(call_latency=0)
+
+    def _bqstorage_client(self):
+        return object()
+
+
+def run_shard_tests():
+    print("\n--- plan_shards ---")
+    assert plan_shards(0, 10) == [(0, 0)]
+    assert plan_shards(25, 10) == [(0, 10), (10, 10), (20, 5)]
+    assert plan_shards(20, 10) == [(0, 10), (10, 10)]
+    print(plan_shards(25, 10))
+
+
+def run_backup_restore_tests():
+    # Con Storage API disponible, los shards deben seguir respetando su rango
+    print("\n--- Backup y restore por shards ---")
+    fake = StorageApiFakeClient()
+    fake.load_table("jobs", pa.table({"id": pa.array(range(25), pa.int64()), "name": [f"job {i}" for i in range(25)]}))
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = backup_dataset(fake, tmp, tables=["jobs"], rows_per_shard=10, max_workers=2)
+        entry = manifest["tables"]["jobs"]
+        assert entry["rows"] == 25
+        assert [shard["rows"] for shard in entry["shards"]] == [10, 10, 5]
+        # Los snapshots se borran al terminar
+        assert all("__snapshot_" not in name for name in fake.client.tables)
+
+        restore_dataset(fake, manifest["manifest_path"], max_workers=2)
+        ids = fake.rows("jobs").column("id").to_pylist()
+        assert sorted(ids) == list(range(25))
+
+        # Un shard alterado no llega a tocar la tabla
+        fake.load_table("jobs", pa.table({"id": pa.array([99], pa.int64()), "name": ["otro"]}))
+        with open(entry["shards"][1]["file"], "ab") as f:
+            f.write(b"x")
+        try:
+            restore_dataset(fake, manifest["manifest_path"])
+            raise AssertionError("El restore debía fallar por checksum")
+        except ValueError as e:
+            print(e)
+        assert fake.rows("jobs").column("id").to_pylist() == [99]
+        print(os.path.basename(manifest["manifest_path"]), entry["rows"], "filas")
+
+
+if __name__ == "__main__":
+    run_shard_tests()
+    run_backup_restore_tests()
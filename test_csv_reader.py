@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+import pyarrow as pa
+
+from csv_reader import read_csv_batches
+
+COLUMNS = ["id", "name"]
+
+
+def write_csv(directory, content):
+    path = os.path.join(directory, "data.csv")
+    with open(path, "wb") as f:
+        f.write(content.encode("utf-8"))
+    return path
+
+
+def read_rows(path, skip_rows=0, on_invalid_row=None):
+    chunks = list(read_csv_batches(path, COLUMNS, skip_rows=skip_rows, on_invalid_row=on_invalid_row))
+    return [row for chunk in chunks for row in chunk.to_dict("records")]
+
+
+def run_header_tests():
+    with tempfile.TemporaryDirectory() as tmp:
+        # Export de Excel: BOM delante del header
+        path = write_csv(tmp, "\ufeffid,name\r\n1,Ventas\r\n2,Compras\r\n")
+        assert read_rows(path) == [{"id": "1", "name": "Ventas"}, {"id": "2", "name": "Compras"}]
+        assert read_rows(path, skip_rows=1) == [{"id": "2", "name": "Compras"}]
+
+        # Sin header: la primera línea son datos
+        path = write_csv(tmp, "1,Ventas\n2,Compras\n")
+        assert read_rows(path) == [{"id": "1", "name": "Ventas"}, {"id": "2", "name": "Compras"}]
+    print("header OK")
+
+
+def run_quoted_newline_tests():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_csv(tmp, '1,"Ventas\nNorte"\n2,Compras\n3,"Logística, ""Sur"""\n')
+        assert read_rows(path) == [
+            {"id": "1", "name": "Ventas\nNorte"},
+            {"id": "2", "name": "Compras"},
+            {"id": "3", "name": 'Logística, "Sur"'},
+        ]
+        # skip_rows cuenta filas, no líneas
+        assert [row["id"] for row in read_rows(path, skip_rows=1)] == ["2", "3"]
+    print("quoted newline OK")
+
+
+def run_ragged_row_tests():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_csv(tmp, "1,Ventas\n2,Compras,extra\n3\n4,Logística\n")
+        invalid = []
+        rows = read_rows(path, on_invalid_row=lambda record, error: invalid.append((record, error)))
+        # Las filas con columnas de más o de menos se omiten y se notifican; el resto se lee
+        assert rows == [{"id": "1", "name": "Ventas"}, {"id": "4", "name": "Logística"}]
+        assert [record["text"] for record, _ in invalid] == ["2,Compras,extra", "3"]
+        assert all(error.startswith("Número de columnas incorrecto") for _, error in invalid)
+
+        # Al reanudar, las filas inválidas ya saltadas no se vuelven a notificar
+        invalid.clear()
+        rows = read_rows(path, skip_rows=2, on_invalid_row=lambda record, error: invalid.append((record, error)))
+        assert rows == [{"id": "4", "name": "Logística"}]
+        assert [record["text"] for record, _ in invalid] == ["3"]
+
+        # Sin on_invalid_row la lectura falla como antes
+        try:
+            read_rows(path)
+        except pa.ArrowInvalid:
+            pass
+        else:
+            raise AssertionError("se esperaba ArrowInvalid")
+    print("ragged rows OK")
+
+
+if __name__ == "__main__":
+    run_header_tests()
+    run_quoted_newline_tests()
+    run_ragged_row_tests()
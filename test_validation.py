@@ -1,36 +1,75 @@
+import pandas as pd
 from validation import validate_departments, validate_jobs, validate_hired_employees
+from validation import validate_departments_df, validate_jobs_df, validate_hired_employees_df
 
-# Casos de prueba
-departments_tests = [
-    {"id": "1", "name": "Ventas"},    # ✅ válido
-    {"id": "2", "name": "NaN"},       # ❌ nombre inválido → DLQ
-    {"id": "", "name": "Soporte"}     # ❌ id faltante → DLQ
-]
-
-jobs_tests = [
-    {"id": "1", "name": "Developer"},  # ✅ válido
-    {"id": "abc", "name": "QA"}        # ❌ id no entero → DLQ
-]
-
-hired_employees_tests = [
-    {"id": "1", "name": "Juan", "datetime": "2020-01-01T12:00:00", "department_id": "1", "job_id": "2"},  # ✅ válido
-    {"id": "2", "name": "NaN", "datetime": "2020-01-01T12:00:00", "department_id": "1", "job_id": "2"},   # ❌ nombre inválido
-    {"id": "3", "name": "", "datetime": "fecha_mala", "department_id": "1", "job_id": "2"},            # ❌ fecha inválida
-    {"id": "4", "name": "Luis", "datetime": "2020-01-01T12:00:00", "department_id": "abc", "job_id": "2"} # ❌ department_id no entero
-]
+# Casos de prueba: funciones que devuelven filas nuevas en cada llamada, porque los
+# validadores por fila modifican el dict que reciben (clean_str, int)
+def departments_tests():
+    return [
+        {"id": "1", "name": "Ventas"},    # ✅ válido
+        {"id": "2", "name": "NaN"},       # ❌ nombre inválido → DLQ
+        {"id": "", "name": "Soporte"},    # ❌ id faltante → DLQ
+        {"id": " 7 ", "name": " RRHH "},  # ✅ válido (espacios)
+        {"id": "null", "name": "Legal"},  # ❌ id nulo → DLQ
+    ]
+
+def jobs_tests():
+    return [
+        {"id": "1", "name": "Developer"},  # ✅ válido
+        {"id": "abc", "name": "QA"},       # ❌ id no entero → DLQ
+        {"id": "+3", "name": "None"},      # ❌ nombre nulo → DLQ
+        {"id": "1.5", "name": "Data"},     # ❌ id no entero → DLQ
+    ]
+
+def hired_employees_tests():
+    return [
+        {"id": "1", "name": "Juan", "datetime": "2020-01-01T12:00:00", "department_id": "1", "job_id": "2"},  # ✅ válido
+        {"id": "2", "name": "NaN", "datetime": "2020-01-01T12:00:00", "department_id": "1", "job_id": "2"},   # ❌ nombre inválido
+        {"id": "3", "name": "", "datetime": "fecha_mala", "department_id": "1", "job_id": "2"},            # ❌ fecha inválida
+        {"id": "4", "name": "Luis", "datetime": "2020-01-01T12:00:00", "department_id": "abc", "job_id": "2"}, # ❌ department_id no entero
+        {"id": " 7 ", "name": "Ana", "datetime": "2021-07-01T08:30:00Z", "department_id": "3", "job_id": " 4"},  # ✅ válido (espacios, Z)
+        {"id": "8", "name": "Eva", "datetime": "2021-02-30T00:00:00Z", "department_id": "1", "job_id": "2"},  # ❌ fecha inexistente
+        {"id": "9", "name": "Leo", "datetime": "2021-13-01", "department_id": "1", "job_id": "2"},           # ❌ fecha inválida
+        {"id": "10", "name": "Mar", "datetime": "2021-03-01T10:00:00-03:00", "department_id": "1", "job_id": "2"},  # ✅ con offset
+        {"id": "11", "name": "Sol", "datetime": "2021-03-01", "department_id": "1", "job_id": "2"},          # ✅ solo fecha
+        {"id": "12", "name": "Ian", "datetime": "", "department_id": "1", "job_id": "2"},                    # ❌ fecha faltante
+    ]
 
 def run_tests():
     print("\n--- Departments ---")
-    for row in departments_tests:
+    for row in departments_tests():
         print(row, "=>", validate_departments(row))
 
     print("\n--- Jobs ---")
-    for row in jobs_tests:
+    for row in jobs_tests():
         print(row, "=>", validate_jobs(row))
 
     print("\n--- Hired Employees ---")
-    for row in hired_employees_tests:
+    for row in hired_employees_tests():
         print(row, "=>", validate_hired_employees(row))
 
+def run_df_tests():
+    # Los validadores vectorizados deben aceptar/rechazar (y devolver) lo mismo que los de
+    # fila, partiendo de los strings crudos tal como llegan del CSV
+    for name, rows, row_validator, df_validator in [
+        ("Departments", departments_tests, validate_departments, validate_departments_df),
+        ("Jobs", jobs_tests, validate_jobs, validate_jobs_df),
+        ("Hired Employees", hired_employees_tests, validate_hired_employees, validate_hired_employees_df),
+    ]:
+        print(f"\n--- {name} (vectorizado) ---")
+        valid_df, rejected_df = df_validator(pd.DataFrame(rows(), dtype=str))
+        expected = [row_validator(row) for row in rows()]
+        assert len(valid_df) + len(rejected_df) == len(expected)
+        for i, (validated, error) in enumerate(expected):
+            if error:
+                assert i in rejected_df.index and i not in valid_df.index, (name, i)
+                assert rejected_df.loc[i, "error"] == error, (name, i, rejected_df.loc[i, "error"], error)
+            else:
+                assert i in valid_df.index, (name, i)
+                assert valid_df.loc[i].to_dict() == validated, (name, i, valid_df.loc[i].to_dict(), validated)
+        print(valid_df.to_dict("records"))
+        print(rejected_df.to_dict("records"))
+
 if __name__ == "__main__":
     run_tests()
+    run_df_tests()
@@ -1,4 +1,8 @@
 from dateutil import parser
+from datetime import datetime
+from functools import lru_cache
+import re
+import pandas as pd
 
 def clean_str(val):
     if val is None:
@@ -10,6 +14,34 @@ def clean_str(val):
     return val
 
 
+# ------------------
+# Parseo de timestamps: ruta rápida con datetime.fromisoformat para ISO-8601 canónico
+# (con o sin Z/offset) y dateutil solo para formatos poco habituales.
+# Mismo resultado que parser.isoparse(val).isoformat().
+# ------------------
+_CANONICAL_TS = re.compile(
+    r"[0-9]{4}-[0-9]{2}-[0-9]{2}T(?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]"
+    r"(?:\.[0-9]{3}|\.[0-9]{6})?"
+    r"(?:Z|[+-](?:[01][0-9]|2[0-3]):[0-5][0-9])?"
+)
+
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(val):
+    """Devuelve el timestamp en formato isoformat(); lanza ValueError si no es válido"""
+    if _CANONICAL_TS.fullmatch(val):
+        if val.endswith("Z"):
+            val = val[:-1] + "+00:00"
+        try:
+            return datetime.fromisoformat(val).isoformat()
+        except ValueError:
+            pass
+    try:
+        return parser.isoparse(val).isoformat()
+    except Exception as e:
+        raise ValueError(str(e))
+
+
 def validate_departments(row):
     row["id"] = clean_str(row.get("id"))
     row["name"] = clean_str(row.get("name"))
@@ -53,15 +85,154 @@ def validate_hired_employees(row):
         return None, "Valores de ID no son enteros"
 
     try:
-        row["hired_timestamp"] = parser.isoparse(row["datetime"])
-    except Exception:
+        row["hired_timestamp"] = parse_timestamp(row["datetime"])
+    except ValueError:
         return None, "Fecha inválida"
 
     # Retornar solo las columnas necesarias para la tabla
     return {
         "id": row["id"],
         "name": row["name"],
-        "hired_timestamp": row["hired_timestamp"].isoformat(),
+        "hired_timestamp": row["hired_timestamp"],
         "department_id": row["department_id"],
         "job_id": row["job_id"]
     }, None
+
+
+# ------------------
+# Validación vectorizada (un chunk completo de pandas a la vez)
+# Mismas reglas y mensajes de error que los validadores por fila.
+# ------------------
+NULL_TOKENS = {"nan", "none", "null", ""}
+
+_STRING = pd.StringDtype("pyarrow")
+_INT_PATTERN = r"[+-]?[0-9]{1,18}"
+_ISO_PATTERN = (
+    r"[0-9]{4}-[0-9]{2}-[0-9]{2}T(?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]"
+    r"(?:Z|[+-](?:[01][0-9]|2[0-3]):[0-5][0-9])?"
+)
+
+
+def _clean_str_series(s):
+    # Equivalente columnar de clean_str: strings limpios (arrow) con <NA> para los faltantes
+    missing = s.isna()
+    if s.dtype == object:
+        s = s.map(str, na_action="ignore")
+    cleaned = s.astype(_STRING).str.strip()
+    missing |= cleaned.str.lower().isin(NULL_TOKENS).fillna(False).astype(bool)
+    return cleaned.where(~missing), missing
+
+
+def _to_int_series(s):
+    # Convierte en bloque los enteros canónicos; el resto pasa por int() para
+    # respetar exactamente la semántica de los validadores por fila
+    fast = s.str.fullmatch(_INT_PATTERN).fillna(False).astype(bool)
+    values = s.where(fast, "0").fillna("0").astype("int64")
+    ok = fast.copy()
+    slow = {}
+    for idx, val in s[~fast & s.notna()].items():
+        try:
+            slow[idx] = int(val)
+        except ValueError:
+            pass
+    if slow:
+        if any(not -2**63 <= v < 2**63 for v in slow.values()):
+            values = values.astype(object)
+        values[list(slow)] = list(slow.values())
+        ok[list(slow)] = True
+    return values, ok
+
+
+def _parse_iso_series(s):
+    # Ruta rápida: ISO-8601 canónico parseado en bloque; el resto, una vez por valor
+    # único con parse_timestamp
+    canonical = s.str.fullmatch(_ISO_PATTERN).fillna(False).astype(bool)
+    base = s.str.slice(0, 19).where(canonical)
+    parsed = pd.to_datetime(base, format="%Y-%m-%dT%H:%M:%S", errors="coerce")
+    fast = canonical & parsed.notna()
+    tz = s.str.slice(19).where(fast)
+    tz = tz.where(~tz.isin(["Z", "-00:00"]).fillna(False).astype(bool), "+00:00")
+    out = (base + tz).where(fast).astype(object).where(fast, None)
+
+    slow = s[~fast & s.notna()]
+    if not slow.empty:
+        cache = {}
+        for val in slow.unique():
+            try:
+                cache[val] = parse_timestamp(val)
+            except ValueError:
+                cache[val] = None
+        out[slow.index] = slow.map(cache).astype(object)
+    return out, out.notna()
+
+
+def _as_object(s):
+    # Columnas de salida como objetos Python (None para faltantes), igual que los dicts por fila
+    return s.astype(object).where(s.notna(), None)
+
+
+def _split(df, errors):
+    # Separa filas válidas y rechazadas (con la columna "error")
+    df = df.apply(lambda col: _as_object(col) if col.dtype == _STRING else col)
+    rejected_mask = errors.notna()
+    rejected = df[rejected_mask].copy()
+    rejected["error"] = errors[rejected_mask]
+    return df[~rejected_mask].copy(), rejected
+
+
+def _validate_dimension_df(df):
+    df = df.copy()
+    df["id"], id_missing = _clean_str_series(df["id"] if "id" in df else pd.Series(None, index=df.index))
+    df["name"], name_missing = _clean_str_series(df["name"] if "name" in df else pd.Series(None, index=df.index))
+
+    errors = pd.Series(None, index=df.index, dtype=object)
+    missing = id_missing | name_missing
+    errors[missing] = "Campos obligatorios faltantes"
+
+    ids, ok = _to_int_series(df["id"].where(~missing, None))
+    errors[~missing & ~ok] = "id no es entero"
+
+    valid, rejected = _split(df, errors)
+    valid["id"] = ids[valid.index]
+    return valid, rejected
+
+
+def validate_departments_df(df):
+    return _validate_dimension_df(df)
+
+
+def validate_jobs_df(df):
+    return _validate_dimension_df(df)
+
+
+def validate_hired_employees_df(df):
+    df = df.copy()
+    missing = pd.Series(False, index=df.index)
+    for col in ["id", "name", "datetime", "department_id", "job_id"]:
+        df[col], col_missing = _clean_str_series(df[col] if col in df else pd.Series(None, index=df.index))
+        missing |= col_missing
+
+    errors = pd.Series(None, index=df.index, dtype=object)
+    errors[missing] = "Campos obligatorios faltantes"
+
+    ints = {}
+    ints_ok = ~missing
+    for col in ["id", "department_id", "job_id"]:
+        ints[col], ok = _to_int_series(df[col].where(~missing, None))
+        ints_ok &= ok
+    errors[~missing & ~ints_ok] = "Valores de ID no son enteros"
+
+    pending = errors.isna()
+    timestamps, ts_ok = _parse_iso_series(df["datetime"].where(pending, None))
+    errors[pending & ~ts_ok] = "Fecha inválida"
+
+    valid, rejected = _split(df, errors)
+    # Retornar solo las columnas necesarias para la tabla
+    valid = pd.DataFrame({
+        "id": ints["id"][valid.index],
+        "name": valid["name"],
+        "hired_timestamp": timestamps[valid.index],
+        "department_id": ints["department_id"][valid.index],
+        "job_id": ints["job_id"][valid.index],
+    }, index=valid.index)
+    return valid, rejected